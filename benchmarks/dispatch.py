@@ -0,0 +1,63 @@
+"""
+Measures events/s through Client.dispatch for every dispatch mode, with a
+handler that returns right away and one that waits once.
+
+Usage: python -m benchmarks.dispatch
+"""
+
+from time import perf_counter
+
+from asyncio import (
+    sleep,
+    new_event_loop
+)
+
+from discord import Client
+
+EVENTS = 100000
+
+
+class BenchmarkClient(Client):
+    handled = 0
+
+    async def on_message(self, ctx):
+        BenchmarkClient.handled += 1
+
+
+class WaitingClient(Client):
+    handled = 0
+
+    async def on_message(self, ctx):
+        await sleep(0)
+        WaitingClient.handled += 1
+
+
+async def run(loop, cls, mode):
+    client = cls(loop=loop, dispatch_mode=mode)
+    cls.handled = 0
+
+    start = perf_counter()
+
+    for index in range(EVENTS):
+        client.dispatch('message', index)
+
+        # Give the loop a turn every now and then, like the gateway does between frames
+        if index % 100 == 0:
+            await sleep(0)
+
+    while cls.handled < EVENTS:
+        await sleep(0)
+
+    print('{name} {mode}: {rate:.0f} events/s'.format(
+        name=cls.__name__,
+        mode=mode,
+        rate=EVENTS / (perf_counter() - start)
+    ))
+
+
+if __name__ == '__main__':
+    loop = new_event_loop()
+
+    for cls in (BenchmarkClient, WaitingClient):
+        for mode in ('task', 'inline', 'batch'):
+            loop.run_until_complete(run(loop, cls, mode))
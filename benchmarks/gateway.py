@@ -0,0 +1,94 @@
+"""
+Runs clients against a local MockGateway, measures events/s and how long
+reconnecting takes after each kind of injected fault.
+
+Usage: python -m benchmarks.gateway [clients] [rate] [seconds]
+"""
+
+import sys
+
+from time import perf_counter
+
+from asyncio import (
+    sleep,
+    gather,
+    new_event_loop
+)
+
+from discord import Client
+from benchmarks.mockgateway import MockGateway
+
+
+class BenchmarkClient(Client):
+    received = 0
+
+    async def on_message(self, ctx):
+        BenchmarkClient.received += 1
+
+
+def get_handshakes(gateway):
+    return gateway.identifies + gateway.resumes
+
+
+async def wait_for_handshakes(gateway, target):
+    start = perf_counter()
+
+    while get_handshakes(gateway) < target:
+        await sleep(0.001)
+
+    return perf_counter() - start
+
+
+async def main(loop, clients, rate, seconds):
+    async with MockGateway(guilds=10, channels=10, users=100, rate=rate) as gateway:
+        tasks = []
+        instances = []
+
+        for index in range(clients):
+            client = BenchmarkClient(loop=loop, gateway=gateway.uri)
+            instances.append(client)
+            tasks.append(loop.create_task(client.start('benchmark-token-{}'.format(index))))
+
+        await wait_for_handshakes(gateway, clients)
+
+        start = perf_counter()
+        await sleep(seconds)
+
+        print('{rate:.0f} events/s received by {clients} client(s)'.format(
+            rate=BenchmarkClient.received / (perf_counter() - start),
+            clients=clients
+        ))
+
+        faults = (
+            ('reconnect', gateway.reconnect),
+            ('invalidate_session', gateway.invalidate_session),
+            ('drop', gateway.drop),
+        )
+
+        for name, fault in faults:
+            target = get_handshakes(gateway) + clients
+
+            result = fault()
+            if result is not None:
+                await result
+
+            print('{name}: all clients connected again after {elapsed:.3f}s'.format(
+                name=name,
+                elapsed=await wait_for_handshakes(gateway, target)
+            ))
+
+            # Let the clients settle before the next fault
+            await sleep(1)
+
+        for client in instances:
+            await client.close()
+
+        await gather(*tasks)
+
+
+if __name__ == '__main__':
+    arguments = [float(value) for value in sys.argv[1:]]
+    clients, rate, seconds = arguments + [1, 1000, 5][len(arguments):]
+
+    loop = new_event_loop()
+    loop.run_until_complete(main(loop, int(clients), rate, seconds))
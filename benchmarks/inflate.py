@@ -0,0 +1,102 @@
+"""
+Measures the cost of DiscordWebsocket.received_message per frame.
+
+Usage: python -m benchmarks.inflate
+"""
+
+import zlib
+import tracemalloc
+
+from time import perf_counter
+from types import SimpleNamespace
+from asyncio import new_event_loop
+
+from discord.util import to_json
+from discord.state import ConnectionState
+from discord.gateway import DiscordWebsocket
+
+FRAMES = 20000
+FRAGMENT_SIZE = 512
+
+
+def create_websocket():
+    loop = new_event_loop()
+    client = SimpleNamespace(loop=loop)
+    client._connection = ConnectionState(
+        loop=loop,
+        token='benchmark-token',
+        dispatch=lambda *args: None,
+        http=None
+    )
+
+    return DiscordWebsocket(client=client, parameters={'initial': True})
+
+
+def create_frames(count):
+    """Compress a stream of MESSAGE_CREATE like packets the way the gateway does"""
+
+    compressor = zlib.compressobj()
+    frames = []
+
+    for sequence in range(count):
+        payload = to_json({
+            'op': 0,
+            's': sequence,
+            't': 'MESSAGE_CREATE',
+            'd': {
+                'id': str(1000000000000000000 + sequence),
+                'type': 0,
+                'content': 'benchmark message {}'.format(sequence) * 4,
+                'channel_id': '1000000000000000001',
+                'author': {
+                    'id': '1000000000000000002',
+                    'username': 'benchmark',
+                    'discriminator': '0',
+                    'avatar': None
+                }
+            }
+        })
+
+        frame = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        frames.append(frame)
+
+    return frames
+
+
+def fragment(frames, size):
+    return [frame[i:i + size] for frame in frames for i in range(0, len(frame), size)]
+
+
+def run(name, frames):
+    websocket = create_websocket()
+    start = perf_counter()
+
+    for frame in frames:
+        websocket.received_message(frame)
+
+    elapsed = perf_counter() - start
+
+    # Second pass on a fresh stream with allocation tracing enabled
+    websocket = create_websocket()
+
+    tracemalloc.start()
+    current, _ = tracemalloc.get_traced_memory()
+
+    for frame in frames:
+        websocket.received_message(frame)
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('{name}: {rate:.0f} frames/s, {peak} bytes peak above baseline'.format(
+        name=name,
+        rate=len(frames) / elapsed,
+        peak=peak - current
+    ))
+
+
+if __name__ == '__main__':
+    frames = create_frames(FRAMES)
+
+    run('single', frames)
+    run('fragmented', fragment(frames, FRAGMENT_SIZE))
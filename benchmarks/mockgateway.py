@@ -0,0 +1,360 @@
+"""
+Copyright (C) [2024] [sepsemi]
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+
+import zlib
+
+from uuid import uuid4
+from logging import getLogger
+
+from asyncio import (
+    sleep,
+    create_task
+)
+
+from websockets.server import serve
+
+from discord.util import (
+    to_json,
+    from_json
+)
+
+from discord.constants import WEBSOCKET_SIZE_LIMIT
+from discord.enum import GatewayOpcode
+
+_log = getLogger(__name__)
+
+# Snowflake ranges used for the generated objects
+GUILD_ID_START = 100000000000000000
+CHANNEL_ID_START = 200000000000000000
+USER_ID_START = 300000000000000000
+MESSAGE_ID_START = 400000000000000000
+
+
+class MockConnection:
+    """A single client connected to the MockGateway"""
+
+    # Messages are sent in batches every tick to sustain high rates
+    TICK = 0.01
+
+    def __init__(self, gateway, websocket):
+        self.gateway = gateway
+        self.websocket = websocket
+
+        self.session_id = None
+        self._pump = None
+        self._zlib = zlib.compressobj()
+
+    async def send(self, payload):
+        data = self._zlib.compress(to_json(payload))
+        data += self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+        await self.websocket.send(data)
+
+    async def dispatch(self, event, data):
+        sequence = self.gateway.sessions[self.session_id] + 1
+        self.gateway.sessions[self.session_id] = sequence
+
+        await self.send({
+            'op': GatewayOpcode.DISPATCH.value,
+            's': sequence,
+            't': event,
+            'd': data
+        })
+
+    async def identify(self, data):
+        self.gateway.identifies += 1
+
+        self.session_id = uuid4().hex
+        self.gateway.sessions[self.session_id] = 0
+
+        guild_hashes = data.get('client_state', {}).get('guild_hashes', {})
+
+        await self.dispatch('READY', self.gateway.get_ready(self.session_id, guild_hashes))
+        self._start_pump()
+
+    async def resume(self, data):
+        # Unknown sessions can't be resumed
+        if data['session_id'] not in self.gateway.sessions:
+            return await self.send({
+                'op': GatewayOpcode.INVALIDATE_SESSION.value,
+                'd': False
+            })
+
+        self.gateway.resumes += 1
+        self.session_id = data['session_id']
+
+        await self.dispatch('RESUMED', None)
+        self._start_pump()
+
+    async def heartbeat(self, data):
+        await self.send({'op': GatewayOpcode.HEARTBEAT_ACK.value, 'd': None})
+
+    def _start_pump(self):
+        if self.gateway.rate > 0 and self._pump is None:
+            self._pump = create_task(self.pump())
+
+    async def pump(self):
+        """Push MESSAGE_CREATE events at the configured rate"""
+
+        batch = max(1, int(self.gateway.rate * self.TICK))
+        interval = batch / self.gateway.rate
+
+        while True:
+            for _ in range(batch):
+                await self.dispatch('MESSAGE_CREATE', self.gateway.get_message())
+
+            await sleep(interval)
+
+    async def run(self):
+        routes = {
+            GatewayOpcode.IDENTIFY.value: self.identify,
+            GatewayOpcode.RESUME.value: self.resume,
+            GatewayOpcode.HEARTBEAT.value: self.heartbeat,
+        }
+
+        await self.send({
+            'op': GatewayOpcode.HELLO.value,
+            'd': {'heartbeat_interval': self.gateway.heartbeat_interval}
+        })
+
+        try:
+            async for message in self.websocket:
+                packet = from_json(message)
+                route = routes.get(packet['op'])
+
+                if route is not None:
+                    await route(packet.get('d'))
+        finally:
+            if self._pump is not None:
+                self._pump.cancel()
+
+
+class MockGateway:
+    """A local gateway speaking enough of the protocol for DiscordWebsocket
+
+    Connect a client to it with Client(gateway=mock.uri).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, guilds=1, channels=1, users=1,
+                 rate=0.0, heartbeat_interval=41250):
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.heartbeat_interval = heartbeat_interval
+
+        self.guild_count = guilds
+        self.channel_count = channels
+        self.user_count = users
+
+        # session_id -> last sequence
+        self.sessions = {}
+        self.connections = set()
+
+        self.identifies = 0
+        self.resumes = 0
+        self.messages = 0
+
+        # Guilds sent as partial because the client had them cached
+        self.partial_guilds = 0
+
+        self._server = None
+
+    @property
+    def uri(self):
+        return 'ws://{self.host}:{self.port}'.format(self=self)
+
+    def _get_user(self, index):
+        return {
+            'id': str(USER_ID_START + index),
+            'username': 'user{}'.format(index),
+            'discriminator': '0',
+            'avatar': None
+        }
+
+    def _get_guild(self, index):
+        guild_id = str(GUILD_ID_START + index)
+        start = CHANNEL_ID_START + index * self.channel_count
+
+        channels = [
+            {
+                'id': str(start + position),
+                'type': 0,
+                'flags': 0,
+                'name': 'channel{}'.format(position),
+                'topic': None,
+                'position': position,
+                'permission_overwrites': []
+            }
+            for position in range(self.channel_count)
+        ]
+
+        # The @everyone role shares the id of the guild
+        roles = [
+            {
+                'id': guild_id,
+                'name': '@everyone',
+                'hoist': False,
+                'version': 0,
+                'position': 0,
+                'mentionable': False,
+                'permissions': str((1 << 10) | (1 << 11))
+            }
+        ]
+
+        guild = {
+            'id': guild_id,
+            'name': 'guild{}'.format(index),
+            'icon': None,
+            'banner': None,
+            'member_count': self.user_count,
+            'roles': roles,
+            'channels': channels
+        }
+
+        metadata = {key: guild[key] for key in ('name', 'icon', 'banner')}
+
+        guild['data_mode'] = 'full'
+        guild['guild_hashes'] = {
+            'version': 1,
+            'metadata': {'hash': self._hash(metadata), 'omitted': False},
+            'channels': {'hash': self._hash(channels), 'omitted': False},
+            'roles': {'hash': self._hash(roles), 'omitted': False}
+        }
+
+        return guild
+
+    def _hash(self, data):
+        return format(zlib.crc32(to_json(data)), 'x')
+
+    def _get_ready_guild(self, index, guild_hashes):
+        guild = self._get_guild(index)
+        hashes = guild_hashes.get(guild['id'])
+
+        if hashes is None:
+            return guild
+
+        # Nothing changed since the client cached it
+        if all(hashes.get(key) == guild['guild_hashes'][key] for key in ('metadata', 'channels', 'roles')):
+            self.partial_guilds += 1
+
+            return {
+                'id': guild['id'],
+                'data_mode': 'partial',
+                'guild_hashes': guild['guild_hashes'],
+                'partial_updates': {}
+            }
+
+        return guild
+
+    def get_ready(self, session_id, guild_hashes=None):
+        user = self._get_user(self.user_count)
+        user.update(email=None, verified=True, premium_type=0)
+
+        return {
+            'v': 9,
+            'session_id': session_id,
+            'resume_gateway_url': self.uri,
+            'user': user,
+            'users': [self._get_user(index) for index in range(self.user_count)],
+            'private_channels': [],
+            'guilds': [
+                self._get_ready_guild(index, guild_hashes or {})
+                for index in range(self.guild_count)
+            ]
+        }
+
+    def get_message(self):
+        index = self.messages
+        self.messages += 1
+
+        guild = index % self.guild_count
+        channel = CHANNEL_ID_START + guild * self.channel_count + index % self.channel_count
+
+        return {
+            'id': str(MESSAGE_ID_START + index),
+            'type': 0,
+            'content': 'message {}'.format(index),
+            'channel_id': str(channel),
+            'guild_id': str(GUILD_ID_START + guild),
+            'author': self._get_user(index % self.user_count)
+        }
+
+    async def _handler(self, websocket, *args):
+        connection = MockConnection(self, websocket)
+        self.connections.add(connection)
+
+        try:
+            await connection.run()
+        except Exception as exception:
+            _log.debug(
+                'Connection ended: %r',
+                exception,
+                extra={
+                    'className': self.__class__.__name__,
+                    'clientId': connection.session_id,
+                }
+            )
+        finally:
+            self.connections.discard(connection)
+
+    async def start(self):
+        self._server = await serve(
+            self._handler,
+            self.host,
+            self.port,
+            max_size=WEBSOCKET_SIZE_LIMIT
+        )
+
+        # Pick up the port when the os assigned one
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def reconnect(self):
+        """Ask every client to reconnect and resume"""
+
+        for connection in list(self.connections):
+            await connection.send({'op': GatewayOpcode.RECONNECT.value, 'd': None})
+
+    async def invalidate_session(self, resumable=False):
+        """Invalidate the session of every client"""
+
+        for connection in list(self.connections):
+            if not resumable:
+                self.sessions.pop(connection.session_id, None)
+
+            await connection.send({
+                'op': GatewayOpcode.INVALIDATE_SESSION.value,
+                'd': resumable
+            })
+
+    def drop(self):
+        """Drop every connection without a close handshake"""
+
+        for connection in list(self.connections):
+            connection.websocket.transport.abort()
@@ -0,0 +1,121 @@
+"""
+Reports the bytes used per cached message, user and channel.
+
+A message owns its (compacted) payload, so its payload is built inside the
+measurement and the message goes through MessageCache.add like a cached one.
+
+Usage: python -m benchmarks.models
+"""
+
+import tracemalloc
+
+from asyncio import new_event_loop
+
+from discord.user import User
+from discord.cache import MessageCache
+from discord.state import ConnectionState
+from discord.channel import channel_factory
+from discord.message import message_factory
+
+COUNT = 10000
+
+
+def create_state():
+    return ConnectionState(
+        loop=new_event_loop(),
+        token='benchmark-token',
+        dispatch=lambda *args: None,
+        http=None
+    )
+
+
+def user_data(index):
+    return {
+        'id': str(300000000000000000 + index),
+        'username': 'user{}'.format(index),
+        'discriminator': '0',
+        'avatar': None
+    }
+
+
+def channel_data(index):
+    return {
+        'id': str(200000000000000000 + index),
+        'type': 0,
+        'flags': 0,
+        'name': 'channel{}'.format(index),
+        'topic': None,
+        'position': index
+    }
+
+
+def message_data(index):
+    return {
+        'id': str(400000000000000000 + index),
+        'type': 0,
+        'content': 'message {}'.format(index),
+        'channel_id': '200000000000000000',
+        'author': user_data(0),
+        'timestamp': '2024-01-01T00:00:00.000000+00:00',
+        'edited_timestamp': None,
+        'tts': False,
+        'mention_everyone': False,
+        'mentions': [],
+        'mention_roles': [],
+        'attachments': [],
+        'embeds': [],
+        'pinned': False,
+        'flags': 0
+    }
+
+
+def cache_message(cache, channel, index):
+    """Decode-to-cache path of a MESSAGE_CREATE, the payload included"""
+
+    message = message_factory(None, channel, message_data(index))
+    cache.add(message)
+
+    return message
+
+
+def measure(name, payloads, create):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+
+    objects = [create(data) for data in payloads]
+
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('{name}: {size:.0f} bytes each'.format(
+        name=name,
+        size=(after - before) / len(objects)
+    ))
+
+    return objects
+
+
+if __name__ == '__main__':
+    state = create_state()
+    channel = channel_factory(state=state, data=channel_data(0))
+
+    # Users and channels don't keep their payloads, those are built up front
+    measure(
+        'user',
+        [user_data(index) for index in range(COUNT)],
+        lambda data: User(state=state, data=data)
+    )
+
+    measure(
+        'channel',
+        [channel_data(index) for index in range(COUNT)],
+        lambda data: channel_factory(state=state, data=data)
+    )
+
+    cache = MessageCache(max_messages=COUNT)
+
+    measure(
+        'cached message',
+        range(COUNT),
+        lambda index: cache_message(cache, channel, index)
+    )
@@ -0,0 +1,38 @@
+"""
+Replays capture files recorded with Client(capture=path) through the whole
+ingest pipeline and reports the throughput.
+
+Usage: python -m benchmarks.replay capture.bin [capture.bin ...]
+"""
+
+import sys
+
+from asyncio import new_event_loop
+
+from discord import Client
+from discord.capture import replay
+
+
+class ReplayClient(Client):
+
+    async def on_message(self, ctx):
+        return None
+
+
+def run(path):
+    loop = new_event_loop()
+    client = ReplayClient(loop=loop)
+
+    stats = loop.run_until_complete(replay(client, path))
+    loop.close()
+
+    print('{path}: {packets} packets in {elapsed:.3f}s, {rate:.0f} packets/s, {bytes} compressed bytes'.format(
+        path=path,
+        rate=stats['packets'] / stats['elapsed'] if stats['elapsed'] else 0.0,
+        **stats
+    ))
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        run(path)
@@ -0,0 +1,112 @@
+"""
+Measures the CPU cost per REST request of HTTPClient, from the Route to
+the decoded body, against a session that answers right away.
+
+Usage: python -m benchmarks.rest
+"""
+
+from time import process_time
+from types import SimpleNamespace
+from asyncio import new_event_loop
+
+from discord.util import to_json
+from discord.device import create_device
+from discord.http import (
+    Route,
+    HTTPClient
+)
+
+REQUESTS = 20000
+MESSAGES = 50
+
+# The best of this many runs is reported
+REPEAT = 5
+
+
+def create_body(count):
+    """A page of channel history"""
+
+    return to_json([
+        {
+            'id': str(1000000000000000000 + index),
+            'type': 0,
+            'content': 'benchmark message {}'.format(index),
+            'channel_id': '1000000000000000001',
+            'timestamp': '2024-01-01T00:00:00.000000+00:00',
+            'author': {
+                'id': '1000000000000000002',
+                'username': 'benchmark',
+                'discriminator': '0',
+                'avatar': None
+            }
+        }
+        for index in range(count)
+    ])
+
+
+class BenchmarkResponse:
+    status = 200
+    headers = {
+        'X-RateLimit-Bucket': 'benchmark',
+        'X-RateLimit-Limit': '1000000000',
+        'X-RateLimit-Remaining': '1000000000',
+        'X-RateLimit-Reset-After': '1.0'
+    }
+
+    def __init__(self, body):
+        self.body = body
+
+    async def read(self):
+        return self.body
+
+    async def text(self):
+        return self.body.decode()
+
+
+class BenchmarkSession:
+    def __init__(self, body):
+        self.response = BenchmarkResponse(body)
+
+    async def get(self, url, **kwargs):
+        return self.response
+
+
+def create_http(loop, body):
+    client = SimpleNamespace(
+        loop=loop,
+        token='benchmark-token',
+        _connection=SimpleNamespace(device=create_device())
+    )
+
+    return HTTPClient(client=client, http_session=BenchmarkSession(body))
+
+
+def run_routes():
+    start = process_time()
+
+    for index in range(REQUESTS):
+        Route('GET', '/channels/{channel_id}/messages', channel_id=index)
+
+    return (process_time() - start) / REQUESTS
+
+
+async def run_requests(http):
+    start = process_time()
+
+    for index in range(REQUESTS):
+        route = Route('GET', '/channels/{channel_id}/messages', channel_id=index % 10)
+        await http.request(route, params={'limit': MESSAGES})
+
+    return (process_time() - start) / REQUESTS
+
+
+if __name__ == '__main__':
+    loop = new_event_loop()
+
+    print('Route: {:.2f}us'.format(min(run_routes() for _ in range(REPEAT)) * 1e6))
+
+    for count in (0, MESSAGES):
+        http = create_http(loop, create_body(count))
+        elapsed = min(loop.run_until_complete(run_requests(http)) for _ in range(REPEAT))
+
+        print('request with {} messages: {:.2f}us'.format(count, elapsed * 1e6))
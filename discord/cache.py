@@ -0,0 +1,275 @@
+"""
+Copyright (C) [2024] [sepsemi]
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+
+import os
+
+from sys import getsizeof
+from threading import Lock
+from time import monotonic
+from collections import OrderedDict
+
+from .util import (
+    to_json,
+    from_json
+)
+
+
+class MessageCache:
+    """Bounded message cache with a global cap and a cap per channel
+
+    With the fifo policy the oldest message is evicted first, with lru the
+    least recently read or updated one. Messages older than ttl seconds are
+    treated as missing and evicted.
+    """
+
+    FIFO = 'fifo'
+    LRU = 'lru'
+
+    def __init__(self, max_messages=5000, max_channel_messages=None, ttl=None, policy=FIFO):
+        if policy not in (self.FIFO, self.LRU):
+            raise ValueError('Unknown cache policy: {}'.format(policy))
+
+        self.max_messages = max_messages
+        self.max_channel_messages = max_channel_messages
+        self.ttl = ttl
+        self.policy = policy
+
+        # id -> (message, channel_id, added, size)
+        self._messages = OrderedDict()
+
+        # id -> added, oldest first, only kept with a ttl (with lru _messages isn't in that order)
+        self._ages = OrderedDict()
+
+        # channel_id -> ordered ids of the cached messages in that channel
+        self._channels = {}
+
+        # Memory accounting
+        self.content_bytes = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __contains__(self, id):
+        return self.get(id) is not None
+
+    def _is_expired(self, added):
+        return self.ttl is not None and monotonic() - added > self.ttl
+
+    def _evict_expired(self):
+        # Oldest first, so everything after the first live message is live as well
+        while self._ages:
+            id, added = next(iter(self._ages.items()))
+
+            if not self._is_expired(added):
+                return None
+
+            self.remove(id)
+            self.expired += 1
+
+    def get(self, id):
+        try:
+            message, channel_id, added, _ = self._messages[id]
+        except KeyError:
+            return None
+
+        if self._is_expired(added):
+            self.remove(id)
+            self.expired += 1
+            return None
+
+        if self.policy == self.LRU:
+            self._messages.move_to_end(id)
+            self._channels[channel_id].move_to_end(id)
+
+        return message
+
+    def add(self, message):
+        if self.max_messages == 0:
+            return None
+
+        id = message.id
+        channel_id = message.channel.id
+
+        if id in self._messages:
+            self.remove(id)
+
+        # Cached messages only keep the fields the properties parse
+        message._compact()
+
+        size = getsizeof(message.content)
+        added = monotonic()
+
+        self._messages[id] = (message, channel_id, added, size)
+        self.content_bytes += size
+
+        if self.ttl is not None:
+            self._ages[id] = added
+
+        channel = self._channels.get(channel_id)
+
+        if channel is None:
+            channel = self._channels[channel_id] = OrderedDict()
+
+        channel[id] = None
+
+        if self.max_channel_messages is not None and len(channel) > self.max_channel_messages:
+            self.remove(next(iter(channel)))
+            self.evicted += 1
+
+        if self.max_messages is not None and len(self._messages) > self.max_messages:
+            self.remove(next(iter(self._messages)))
+            self.evicted += 1
+
+        if self.ttl is not None:
+            self._evict_expired()
+
+    def remove(self, id):
+        """Remove and return the message, None if it was not cached"""
+
+        entry = self._messages.pop(id, None)
+
+        if entry is None:
+            return None
+
+        message, channel_id, _, size = entry
+        self.content_bytes -= size
+
+        if self.ttl is not None:
+            del self._ages[id]
+
+        channel = self._channels[channel_id]
+        del channel[id]
+
+        if not channel:
+            del self._channels[channel_id]
+
+        return message
+
+    def update(self, message, data):
+        """Update the cached message in place and account for its new size"""
+
+        message._update(data)
+
+        entry = self._messages.get(message.id)
+
+        if entry is None:
+            return None
+
+        cached, channel_id, added, size = entry
+        new_size = getsizeof(message.content)
+
+        # Same key, so the message keeps its place in the order
+        self._messages[message.id] = (cached, channel_id, added, new_size)
+        self.content_bytes += new_size - size
+
+    def remove_channel(self, channel_id):
+        """Drop every cached message of a channel"""
+
+        for id in list(self._channels.get(channel_id, ())):
+            self.remove(id)
+
+    def stats(self):
+        return {
+            'messages': len(self._messages),
+            'channels': len(self._channels),
+            'content_bytes': self.content_bytes,
+            'evicted': self.evicted,
+            'expired': self.expired
+        }
+
+
+class GuildCache:
+    """Keeps the guild data of every client in a JSON file, with the hashes it came with
+
+    The hashes are sent on IDENTIFY, READY then only contains what changed
+    for those guilds (data_mode partial) and the rest is rebuilt from here.
+    flush() can be called from a worker thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._dirty = False
+        self._lock = Lock()
+
+        # client id -> guild id -> {'hashes': ..., 'data': ...}
+        self._clients = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as fp:
+                return from_json(fp.read())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def hashes(self, id):
+        """Return the guild_hashes to send on IDENTIFY"""
+
+        return {
+            guild_id: entry['hashes']
+            for guild_id, entry in self._clients.get(id, {}).items()
+        }
+
+    def get(self, id, guild_id):
+        """Return the cached guild data, None if it is not cached"""
+
+        entry = self._clients.get(id, {}).get(guild_id)
+
+        if entry is None:
+            return None
+
+        return entry['data']
+
+    def set(self, id, guild_id, hashes, data):
+        self._clients.setdefault(id, {})[guild_id] = {
+            'hashes': hashes,
+            'data': data
+        }
+        self._dirty = True
+
+    def delete(self, id, guild_id):
+        if self._clients.get(id, {}).pop(guild_id, None) is not None:
+            self._dirty = True
+
+    def clear(self, id):
+        """Forget every guild of the client"""
+
+        if self._clients.pop(id, None):
+            self._dirty = True
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return None
+
+            # Encoded in one go while holding the GIL, so this is a consistent snapshot
+            data = to_json(self._clients)
+            self._dirty = False
+
+            temporary = self.path + '.tmp'
+
+            try:
+                with open(temporary, 'wb') as fp:
+                    fp.write(data)
+
+                os.replace(temporary, self.path)
+            except BaseException:
+                self._dirty = True
+                raise
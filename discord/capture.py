@@ -0,0 +1,149 @@
+"""
+Copyright (C) [2024] [sepsemi]
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+
+from time import (
+    time,
+    perf_counter
+)
+
+from struct import Struct
+from asyncio import sleep
+from logging import getLogger
+
+_log = getLogger(__name__)
+
+# Every record is a timestamp, the frame length and the raw frame
+HEADER = Struct('<dI')
+
+
+class FrameWriter:
+    """Appends the raw compressed gateway frames to a capture file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fp = open(path, 'ab')
+
+        # An empty record marks the start of a new connection (and zlib stream)
+        self.write(b'')
+
+    def write(self, data):
+        self._fp.write(HEADER.pack(time(), len(data)))
+        self._fp.write(data)
+
+    def close(self):
+        self._fp.close()
+
+
+def read_frames(path):
+    """Yields (timestamp, frame) for every record in a capture file"""
+
+    with open(path, 'rb') as fp:
+        while True:
+            header = fp.read(HEADER.size)
+
+            if len(header) < HEADER.size:
+                return
+
+            timestamp, length = HEADER.unpack(header)
+            yield timestamp, fp.read(length)
+
+
+class ReplayWebsocket:
+    """Stands in for the websocket connection, everything sent is discarded"""
+
+    def __init__(self):
+        self.open = True
+
+    async def send(self, data):
+        return None
+
+    async def close(self, code=1000):
+        self.open = False
+
+
+async def replay(client, path, speed=None):
+    """Push a capture file through the gateway and ConnectionState without a network
+
+    With speed set, the original timing between frames is kept (scaled by speed),
+    otherwise frames are processed as fast as possible.
+    """
+
+    # Imported here, the gateway imports this module for capturing
+    from .gateway import ReconnectWebSocket
+
+    if client.token is None:
+        client.token = 'replay-capture'
+
+    client._connection = client._get_connection()
+
+    websocket = None
+    previous = None
+
+    stats = {
+        'frames': 0,
+        'bytes': 0,
+        'packets': 0,
+        'connections': 0,
+        'elapsed': 0.0
+    }
+
+    start = perf_counter()
+
+    for timestamp, data in read_frames(path):
+        if speed is not None and previous is not None:
+            await sleep((timestamp - previous) / speed)
+
+        previous = timestamp
+
+        if not data:
+            if websocket is not None:
+                await websocket.close()
+
+            # Every connection has its own zlib stream
+            websocket = client._get_websocket({'initial': True})
+            websocket._websocket = ReplayWebsocket()
+            client._websocket = websocket
+
+            stats['connections'] += 1
+            continue
+
+        stats['frames'] += 1
+        stats['bytes'] += len(data)
+
+        message = websocket.received_message(data)
+
+        if message is None:
+            continue
+
+        stats['packets'] += 1
+
+        try:
+            await websocket.handle_dispatch_route(message)
+        except ReconnectWebSocket:
+            # The recording continues with the next connection
+            continue
+
+    if websocket is not None:
+        await websocket.close()
+
+    await client._connection.http.close()
+
+    stats['elapsed'] = perf_counter() - start
+
+    return stats
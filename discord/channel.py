@@ -41,6 +41,7 @@ class ChannelType(IntEnum):
 
 
 class IChannel(ABC):
+    __slots__ = ()
 
     @abstractmethod
     def _update(self, data):
@@ -49,6 +50,12 @@ class IChannel(ABC):
 
 @dataclass
 class Channel(IChannel):
+    __slots__ = (
+        '_state',
+        'id',
+        'type',
+        'flags',
+    )
 
     id: int
     type: ChannelType
@@ -66,6 +73,14 @@ class Channel(IChannel):
 
 @dataclass
 class PrivateChannel(IChannel):
+    __slots__ = (
+        '_state',
+        'id',
+        'type',
+        'flags',
+        'recipients',
+    )
+
     id: int
     type: ChannelType
     flags: int
@@ -82,10 +97,7 @@ class PrivateChannel(IChannel):
 
         if 'recipients' in data.keys():
             self.recipients = [
-                User(
-                    state=self._state,
-                    data=recipient
-                )
+                self._state.store_user(recipient)
                 for recipient in data['recipients']
             ]
 
@@ -98,8 +110,11 @@ class PrivateChannel(IChannel):
         recipients = []
 
         for recipient_id in recipient_ids:
-            recipient_id = int(recipient_id)
-            recipients.append(self._state._users[recipient_id])
+            recipient = self._state._users.get(int(recipient_id))
+
+            # Not sent along with READY, skip it rather than failing the whole channel
+            if recipient is not None:
+                recipients.append(recipient)
 
         return recipients
 
@@ -109,6 +124,16 @@ class PrivateChannel(IChannel):
 
 @dataclass
 class GroupChannel(IChannel):
+    __slots__ = (
+        '_state',
+        'id',
+        'type',
+        'flags',
+        'name',
+        'icon',
+        'recipients',
+    )
+
     id: int
     type: ChannelType
     flags: int
@@ -141,15 +166,25 @@ class GroupChannel(IChannel):
 
 @dataclass
 class GuildTextChannel(IChannel):
+    __slots__ = (
+        '_state',
+        'id',
+        'type',
+        'flags',
+        'position',
+        'name',
+        'topic',
+    )
+
     id: int
     type: ChannelType
     flags: int
     position: int
     name: str
-    topic: str = None
+    topic: str
 
     def __init__(self, channel, data):
-        self._state = channel
+        self._state = channel._state
         self.id = channel.id
         self.type = channel.type
         self.flags = channel.flags
@@ -27,6 +27,7 @@ from asyncio import (
     set_event_loop
 )
 
+from time import perf_counter
 from logging import getLogger
 
 from .state import ConnectionState
@@ -42,21 +43,118 @@ from .iterators import (
 )
 
 from .http import HTTPClient
-
-DEFAULT_SLEEP_TIME = 1
+from .dispatch import (
+    EventStream,
+    EventBatcher,
+    DispatchBatch,
+    HandlerScheduler,
+    create_eager_task
+)
+from .constants import (
+    BATCH_SIZE,
+    BATCH_TIMEOUT,
+    HANDLER_QUEUE_SIZE,
+    EVENT_STREAM_SIZE
+)
 
 _log = getLogger(__name__)
 
 
 class Client:
 
+    # Every option the client and its state understand, anything else is a typo
+    OPTIONS = frozenset((
+        'loop',
+        'gateway',
+        'capture',
+        'capabilities',
+        'offload_threshold',
+        'executor',
+        'backoff_base',
+        'backoff_max',
+        'connect_limiter',
+        'session_store',
+        'guild_cache',
+        'metrics',
+        'max_messages',
+        'max_channel_messages',
+        'message_ttl',
+        'message_cache_policy',
+        'ingest_queue_size',
+        'ingest_overflow',
+        'dispatch_mode',
+        'max_concurrency',
+        'handler_queue_size',
+        'handler_overflow',
+        'batch_size',
+        'batch_timeout',
+        'http_session',
+        'http_pool_size',
+        'http_pool_size_per_host',
+        'http_keepalive_timeout',
+    ))
+
     def __init__(self, **options):
+        unknown = options.keys() - self.OPTIONS
+
+        if unknown:
+            raise TypeError('Unknown option{}: {}'.format(
+                's' if len(unknown) > 1 else '',
+                ', '.join(sorted(unknown))
+            ))
+
         self.token = None
         self.loop = self._get_event_loop(options)
 
+        # Everything else is passed on to the ConnectionState
+        self._options = {k: v for k, v in options.items() if k != 'loop'}
+
         self._websocket = None
         self._connection = None
 
+        # When the current (re)connect started, None while connected
+        self._incident = None
+
+        # Limits the handlers running at once in the task dispatch mode, an int for every event or {event: int}
+        self._max_concurrency = options.get('max_concurrency', None)
+        self._handler_queue_size = options.get('handler_queue_size', HANDLER_QUEUE_SIZE)
+        self._handler_overflow = options.get('handler_overflow', HandlerScheduler.DROP)
+        self._handler_schedulers = {}
+
+        # How handlers are run: a task per event, a task started inline or batched per loop iteration
+        self._dispatch_mode = options.get('dispatch_mode', 'task')
+        self._schedule = self._get_scheduler(self._dispatch_mode)
+
+        # Listeners added with add_listener, event -> [coro]
+        self._listeners = {}
+
+        # Open EventStreams, see events()
+        self._streams = []
+
+        # Events handled by an on_<event>_batch method, event -> EventBatcher
+        self._batch_size = options.get('batch_size', BATCH_SIZE)
+        self._batch_timeout = options.get('batch_timeout', BATCH_TIMEOUT)
+        self._batchers = {}
+
+        # Set by close(), stops reconnecting
+        self._closed = False
+
+        # Event name, e.g. 'message' -> every listener of that event
+        self._handlers = self._get_handlers()
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+
+        # Handlers assigned before __init__ is done are picked up by it
+        if name.startswith('on_') and '_handlers' in self.__dict__:
+            self._update_handlers()
+
+    def __delattr__(self, name):
+        super().__delattr__(name)
+
+        if name.startswith('on_') and '_handlers' in self.__dict__:
+            self._update_handlers()
+
     def _get_event_loop(self, options):
         """Return a event loop"""
 
@@ -67,6 +165,73 @@ class Client:
         set_event_loop(loop)
         return loop
 
+    def _get_scheduler(self, mode):
+        # Inline handlers start right away and batches run one after the other, neither can be limited
+        if mode != 'task' and self._max_concurrency is not None:
+            raise ValueError('max_concurrency only applies to the task dispatch mode')
+
+        if mode == 'task' and self._max_concurrency is not None:
+            return self._schedule_limited_event
+
+        if mode == 'task':
+            return self._schedule_event
+
+        if mode == 'inline':
+            return self._run_event
+
+        if mode == 'batch':
+            self._batch = DispatchBatch(self.loop)
+            return self._batch_event
+
+        raise ValueError('Unknown dispatch mode: {}'.format(mode))
+
+    def _get_handlers(self):
+        """Return the listeners of every handled event, the on_ method first
+
+        The EventBatchers of the on_<event>_batch methods are set up here as well.
+        """
+
+        handlers = {}
+        batchers = {}
+
+        for attr in dir(self):
+            if not attr.startswith('on_') or not callable(getattr(self, attr)):
+                continue
+
+            # Collected by an EventBatcher instead of being dispatched one by one
+            if attr.endswith('_batch'):
+                event = attr[3:-6]
+                batchers[event] = self._get_batcher(event, getattr(self, attr))
+                handlers.setdefault(event, [])
+                continue
+
+            handlers.setdefault(attr[3:], []).insert(0, getattr(self, attr))
+
+        # A rebound or removed batch handler still gets what was collected for it
+        for event, batcher in self._batchers.items():
+            if batchers.get(event) is not batcher:
+                batcher._flush()
+
+        self._batchers = batchers
+
+        for event, listeners in self._listeners.items():
+            handlers.setdefault(event, []).extend(listeners)
+
+        # Streams need the events dispatched, even without a listener
+        for stream in self._streams:
+            for event in stream.names:
+                handlers.setdefault(event, [])
+
+        return {event: tuple(listeners) for event, listeners in handlers.items()}
+
+    def _update_handlers(self):
+        """Recompute the handled events and let the state drop the rest"""
+
+        self._handlers = self._get_handlers()
+
+        if self._connection is not None:
+            self._connection.update_handlers(self._handlers)
+
     def _get_connection(self):
         """Return a ConnectionState"""
 
@@ -74,7 +239,9 @@ class Client:
             loop=self.loop,
             token=self.token,
             dispatch=self.dispatch,
-            http=HTTPClient(client=self)
+            http=HTTPClient(client=self, **self._options),
+            handlers=self._handlers,
+            **self._options
         )
 
     def _get_websocket(self, parameters):
@@ -85,30 +252,249 @@ class Client:
             parameters=parameters
         )
 
+    def _get_batcher(self, event, handler):
+        """Return the EventBatcher of the event, kept when the handler didn't change"""
+
+        batcher = self._batchers.get(event)
+
+        if batcher is not None and batcher.handler == handler:
+            return batcher
+
+        return EventBatcher(
+            loop=self.loop,
+            handler=handler,
+            size=self._batch_size,
+            timeout=self._batch_timeout
+        )
+
     def _schedule_event(self, coro, event_name, *args, **kwargs):
         # Schedules the task
-        return create_task(coro(*args, **kwargs), name=event_name)
+        return create_task(coro(*args, **kwargs))
 
-    def dispatch(self, event, *args, **kwargs):
-        method = 'on_{}'.format(event)
+    def _get_handler_scheduler(self, event):
+        """Return the HandlerScheduler of the event, None if it is not limited"""
+
+        if isinstance(self._max_concurrency, dict):
+            concurrency = self._max_concurrency.get(event)
+        else:
+            concurrency = self._max_concurrency
+
+        if concurrency is None:
+            return None
+
+        return HandlerScheduler(
+            loop=self.loop,
+            event=event,
+            concurrency=concurrency,
+            maxsize=self._handler_queue_size,
+            overflow=self._handler_overflow,
+            metrics=self._connection.metrics,
+            client_id=self._connection.id
+        )
 
+    def _schedule_limited_event(self, coro, event_name, *args, **kwargs):
         try:
-            coro = getattr(self, method)
-        except AttributeError:
+            scheduler = self._handler_schedulers[event_name]
+        except KeyError:
+            scheduler = self._handler_schedulers[event_name] = self._get_handler_scheduler(event_name)
+
+        if scheduler is None:
+            return self._schedule_event(coro, event_name, *args, **kwargs)
+
+        return scheduler.add(coro, args, kwargs)
+
+    def _run_event(self, coro, event_name, *args, **kwargs):
+        # Runs until the handler waits, in a task of its own
+        return create_eager_task(coro(*args, **kwargs), self.loop)
+
+    def _batch_event(self, coro, event_name, *args, **kwargs):
+        return self._batch.add(coro(*args, **kwargs))
+
+    def dispatch(self, event, *args, **kwargs):
+        # The parsers dispatch unconditionally, an event without handlers ends here
+        listeners = self._handlers.get(event)
+
+        if listeners is None:
             return None
 
-        self._schedule_event(coro, method, *args, **kwargs)
+        for stream in self._streams:
+            stream.put(event, args)
+
+        if self._batchers:
+            batcher = self._batchers.get(event)
+
+            if batcher is not None:
+                batcher.add(args)
+
+        for listener in listeners:
+            self._schedule(listener, event, *args, **kwargs)
+
+    def event(self, coro):
+        """Registers a coroutine as the handler of the event it is named after"""
+
+        setattr(self, coro.__name__, coro)
+        return coro
+
+    def events(self, *names, guild_id=None, channel_id=None, maxsize=EVENT_STREAM_SIZE, overflow=EventStream.DROP):
+        """Return an EventStream of the named events, e.g.
+
+        async with client.events('message', guild_id=id) as events:
+            async for event in events:
+                ...
+        """
+
+        stream = EventStream(
+            client=self,
+            names=names,
+            guild_id=guild_id,
+            channel_id=channel_id,
+            maxsize=maxsize,
+            overflow=overflow
+        )
+
+        self._streams.append(stream)
+        self._update_handlers()
+
+        return stream
+
+    def _remove_stream(self, stream):
+        if stream in self._streams:
+            self._streams.remove(stream)
+            self._update_handlers()
+
+    def _get_listener_event(self, coro, name):
+        name = name or coro.__name__
+
+        if name.startswith('on_'):
+            return name[3:]
+
+        return name
+
+    def add_listener(self, coro, name=None):
+        """Adds a listener next to the on_ method, name defaults to the name of coro"""
+
+        event = self._get_listener_event(coro, name)
+
+        self._listeners.setdefault(event, []).append(coro)
+        self._update_handlers()
+
+    def remove_listener(self, coro, name=None):
+        event = self._get_listener_event(coro, name)
+        listeners = self._listeners.get(event, [])
+
+        if coro in listeners:
+            listeners.remove(coro)
+
+        if not listeners:
+            self._listeners.pop(event, None)
+
+        self._update_handlers()
 
     @property
     def channels(self):
         return (channel for channel in self._connection._channels.values())
 
+    @property
+    def guilds(self):
+        return (guild for guild in self._connection._guilds.values())
+
+    def get_channel(self, id):
+        """Returns the cached channel with this id or None"""
+
+        return self._connection._channels.get(id)
+
+    def get_guild(self, id):
+        """Returns the cached guild with this id or None"""
+
+        return self._connection._guilds.get(id)
+
+    def get_user(self, id):
+        """Returns the cached user with this id or None"""
+
+        return self._connection._users.get(id)
+
+    def get_dm_channel(self, user_id):
+        """Returns the direct message channel with this user or None"""
+
+        return self._connection._dm_channels.get(user_id)
+
+    def get_channel_guild(self, channel_id):
+        """Returns the guild the channel belongs to or None"""
+
+        return self._connection._channel_guilds.get(channel_id)
+
+    @property
+    def latency(self):
+        """The latency of the last acknowledged heartbeat in seconds, None before connecting"""
+
+        if self._connection is None:
+            return None
+
+        return self._connection.latency_stats.last
+
+    @property
+    def latency_stats(self):
+        """Rolling heartbeat statistics: last, count, missed, p50, p95, p99 and max"""
+
+        if self._connection is None:
+            return None
+
+        return self._connection.latency_stats.to_dict()
+
+    @property
+    def loop_stats(self):
+        """Seconds the gateway blocked the event loop in total and at most at once, and the offloaded frames"""
+
+        if self._connection is None:
+            return None
+
+        return self._connection.loop_stats.to_dict()
+
+    @property
+    def ingest_stats(self):
+        """Pending, high water, dropped and spilled packets of the current connection"""
+
+        if self._websocket is None:
+            return None
+
+        return self._websocket.ingest.stats()
+
+    @property
+    def ready_bytes(self):
+        """Size of the last READY payload, it shrinks with fewer capabilities"""
+
+        if self._websocket is None:
+            return 0
+
+        return self._websocket.ready_bytes
+
+    @property
+    def handler_stats(self):
+        """Running, pending, dropped and completed handler calls of every limited event"""
+
+        return {
+            event: scheduler.stats()
+            for event, scheduler in self._handler_schedulers.items()
+            if scheduler is not None
+        }
+
+    @property
+    def message_cache_stats(self):
+        """Size and eviction counters of the message cache"""
+
+        if self._connection is None:
+            return None
+
+        return self._connection._messages.stats()
+
     @property
     def user(self):
         return self._connection._user
 
     @property
     def users(self):
+        """The users from READY and every other user a cached object still refers to"""
+
         return (user for user in self._connection._users.values())
 
     def history(self, channel):
@@ -139,11 +525,12 @@ class Client:
         )
 
     def _update_parameters(self, params, resume):
+        # Dispatches queued before an invalidated session still moved the sequence
         params.update(
             resume=resume,
             uri=self._websocket.uri,
-            sequence=self._websocket.sequence,
-            session=self._websocket.session_id,
+            sequence=self._websocket.sequence if resume else None,
+            session=self._websocket.session_id if resume else None,
         )
 
         _log.debug(
@@ -155,14 +542,125 @@ class Client:
             }
         )
 
+    def _forget_session(self, parameters):
+        """IDENTIFY on the default gateway instead of resuming"""
+
+        _log.info(
+            'Not resuming session=%s, there is no READY to resume onto',
+            parameters.get('session'),
+            extra={
+                'className': self.__class__.__name__,
+                'clientId': self._connection.id,
+            }
+        )
+
+        parameters.update(resume=False, sequence=None, session=None)
+        parameters.pop('uri', None)
+
+    def _get_saved_parameters(self):
+        """Restore the state of a previous process, return the parameters to resume its session"""
+
+        store = self._connection.session_store
+
+        if store is None:
+            return {}
+
+        saved = store.load(self._connection.id)
+
+        if saved is None:
+            return {}
+
+        _log.info(
+            'Found saved session=%s, sequence=%s, events=%d',
+            saved['session'],
+            saved['sequence'],
+            len(saved['events']),
+            extra={
+                'className': self.__class__.__name__,
+                'clientId': self._connection.id,
+            }
+        )
+
+        # Without its READY there is nothing to resume onto, _connect then IDENTIFYs
+        if saved['ready'] is not None:
+            self._connection.restore(saved['ready'], saved['events'])
+
+        return {
+            'resume': True,
+            'uri': saved['uri'],
+            'session': saved['session'],
+            'sequence': saved['sequence']
+        }
+
     async def connect(self, reconnect=True):
         parameters = {'initial': True}
 
         # Everything is stored here, never EVER create a new instance
         self._connection = self._get_connection()
 
+        # A saved session is resumed onto the state rebuilt from its READY
+        parameters.update(self._get_saved_parameters())
+
+        try:
+            await self._connect(parameters, reconnect)
+        finally:
+            await self._flush_batchers()
+
+            if self._connection.session_store is not None:
+                self._connection.session_store.flush()
+
+            if self._connection.guild_cache is not None:
+                self._connection.guild_cache.flush()
+
+    def _handshake_done(self, future):
+        """Free the connect slot and record how long (re)connecting took"""
+
+        self._connection.connect_limiter.release()
+
+        # The connection ended before READY or RESUMED
+        if future.cancelled():
+            return None
+
+        backoff = self._connection.backoff
+        metrics = self._connection.metrics
+
+        elapsed = perf_counter() - self._incident
+        attempts = backoff.attempts + 1
+
+        metrics.record('connect.time', elapsed, self._connection.id)
+        metrics.record('connect.attempts', attempts, self._connection.id)
+
+        _log.info(
+            'Received %s after %.3fs and %d attempt%s',
+            future.result(),
+            elapsed,
+            attempts,
+            's' if attempts > 1 else '',
+            extra={
+                'className': self.__class__.__name__,
+                'clientId': self._connection.id,
+            }
+        )
+
+        self._incident = None
+        backoff.reset()
+
+    async def _connect(self, parameters, reconnect):
+        backoff = self._connection.backoff
+        limiter = self._connection.connect_limiter
+
+        self._incident = perf_counter()
+
         while True:
+            # RESUMED only replays what was missed, without READY there is nothing to replay onto
+            if parameters.get('resume') and not self._connection._ready:
+                self._forget_session(parameters)
+
+            # Only a limited number of clients may IDENTIFY or RESUME at once
+            await limiter.acquire()
+
             self._websocket = self._get_websocket(parameters)
+            self._websocket.handshake.add_done_callback(self._handshake_done)
 
             # Poll the websocket for events
             try:
@@ -179,15 +677,43 @@ class Client:
 
                 # Updfate the parameters based on the exception resume
                 self._update_parameters(parameters, exception.resume)
-                continue
+            else:
+                if reconnect is False:
+                    return None
+
+                # Always resume
+                self._update_parameters(parameters, resume=True)
+            finally:
+                # Releases the slot when we never got READY or RESUMED
+                self._websocket.handshake.cancel()
 
-            if reconnect is False:
+            if self._closed:
                 return None
 
-            # Always resume
-            self._update_parameters(parameters, resume=True)
+            if self._incident is None:
+                self._incident = perf_counter()
+
+            await sleep(backoff.delay())
+
+    async def _flush_batchers(self):
+        """Hand what the EventBatchers collected to the batch handlers and wait for them"""
+
+        for batcher in list(self._batchers.values()):
+            await batcher.flush()
 
-            await sleep(DEFAULT_SLEEP_TIME)
+    async def close(self):
+        """Disconnect, hand the events still collected to the batch handlers and close the HTTP session"""
+
+        self._closed = True
+
+        if self._websocket is not None:
+            await self._websocket.close()
+
+        await self._flush_batchers()
+
+        # Last, the batch handlers may still make requests
+        if self._connection is not None:
+            await self._connection.http.close()
 
     async def start(self, token, reconnect=True):
         """Starts the connection"""
@@ -208,6 +734,8 @@ class Client:
         try:
             self.loop.run_until_complete(coro)
         except KeyboardInterrupt:
+            self.loop.run_until_complete(self.close())
+
             for task in all_tasks(loop=self.loop):
                 task.cancel()
 
@@ -39,4 +39,40 @@ TOKEN_ID_LENGTH = 12
 # Max time we wait for receiving anything
 HEARTBEAT_TIMEOUT = 45.0
 
+# Reconnect delays, exponential with full jitter
+RECONNECT_BACKOFF_BASE = 1.0
+RECONNECT_BACKOFF_MAX = 60.0
+
+# Max clients in a process waiting for READY or RESUMED at the same time
+MAX_CONCURRENT_CONNECTS = 4
+
+# Max messages in the message cache of a client
+MAX_MESSAGES = 5000
+
+# Max packets waiting to be processed per connection
+INGEST_QUEUE_SIZE = 10000
+
+# Max handler calls waiting per event when the concurrency is limited
+HANDLER_QUEUE_SIZE = 1000
+
+# Max events and seconds before a batch is handed to on_<event>_batch
+BATCH_SIZE = 100
+BATCH_TIMEOUT = 0.1
+
+# Max events waiting in an EventStream
+EVENT_STREAM_SIZE = 1000
+
+# Max events a SessionStore keeps after READY, past it a restart IDENTIFYs
+SESSION_JOURNAL_SIZE = 1000
+
+# Gateway capabilities sent on IDENTIFY, see Capabilities
+CAPABILITIES = 1021
+
 HTTP_API_URL = 'https://discord.com/api/v{version}'.format(version=API_VERSION)
+
+# HTTP connection pool, connections are kept alive for KEEPALIVE_TIMEOUT seconds when idle
+DNS_CACHE_TTL = 300
+MAX_SIZE_POOL = 100
+MAX_SIZE_POOL_PER_HOST = 10
+KEEPALIVE_TIMEOUT = 30.0
+ESTABLISHED_CONNECTION_TIMEOUT = 1800.0
@@ -52,12 +52,13 @@ USER_AGENTS = (
 
 class Device:
 
-    __slots__ = ('build_number', 'user_agent', 'browser_version')
+    __slots__ = ('build_number', 'user_agent', 'browser_version', '_x_super_properties')
 
     def __init__(self, user_agent, browser_version, build_number):
         self.build_number = build_number
         self.user_agent = user_agent
         self.browser_version = browser_version
+        self._x_super_properties = None
 
     @property
     def headers(self):
@@ -80,8 +81,11 @@ class Device:
 
     @property
     def x_super_properties(self):
-        headers = self.headers
-        return urlsafe_b64encode(to_json(headers)).decode()
+        # Sent with every request, the device never changes so it's encoded once
+        if self._x_super_properties is None:
+            self._x_super_properties = urlsafe_b64encode(to_json(self.headers)).decode()
+
+        return self._x_super_properties
 
 
 def get_browser_version(agent):
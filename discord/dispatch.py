@@ -0,0 +1,426 @@
+"""
+Copyright (C) [2024] [sepsemi]
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+
+from sys import version_info
+from time import perf_counter
+from collections import deque
+
+from asyncio import (
+    Task,
+    get_running_loop
+)
+
+from .guild import Guild
+from .channel import IChannel
+from .message import Message
+from .constants import EVENT_STREAM_SIZE
+
+
+def _report(loop, exception):
+    # Same report as an event handler task that raised
+    loop.call_exception_handler({
+        'message': 'Exception in event handler',
+        'exception': exception
+    })
+
+
+# Task(eager_start=True) exists from Python 3.12 on
+EAGER_TASKS = version_info >= (3, 12)
+
+
+def create_eager_task(coro, loop):
+    """Return a Task that runs the coroutine right away, until it first waits
+
+    Before Python 3.12 it is a regular task, started on the next loop iteration.
+    """
+
+    if EAGER_TASKS:
+        return Task(coro, loop=loop, eager_start=True)
+
+    return loop.create_task(coro)
+
+
+class DispatchBatch:
+    """Collects the handler calls of a loop iteration and runs them in one task
+
+    The handlers run one after the other in dispatch order, a handler that
+    waits holds up the rest of the batch.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._calls = []
+
+    def add(self, coro):
+        self._calls.append(coro)
+
+        # The first call of this iteration schedules the task for all of them
+        if len(self._calls) == 1:
+            self.loop.create_task(self._run())
+
+    async def _run(self):
+        calls, self._calls = self._calls, []
+
+        for coro in calls:
+            try:
+                await coro
+            except Exception as exception:
+                _report(self.loop, exception)
+
+
+class EventBatcher:
+    """Collects the events of one type and hands them to on_<event>_batch as a list
+
+    A batch is handed over once size events are collected, or timeout seconds
+    after its first event. Batches are handled one at a time so the order is
+    kept. Events with a single argument are collected as that argument, the
+    others as a tuple of their arguments.
+    """
+
+    def __init__(self, loop, handler, size, timeout):
+        self.loop = loop
+        self.handler = handler
+        self.size = size
+        self.timeout = timeout
+
+        self._items = []
+        self._timer = None
+
+        # Full batches waiting for the previous one to be handled
+        self._batches = deque()
+        self._task = None
+
+    def add(self, args):
+        self._items.append(args[0] if len(args) == 1 else args)
+
+        if len(self._items) >= self.size:
+            return self._flush()
+
+        if self._timer is None:
+            self._timer = self.loop.call_later(self.timeout, self._flush)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._items:
+            return None
+
+        items, self._items = self._items, []
+        self._batches.append(items)
+
+        if self._task is None:
+            self._task = self.loop.create_task(self._deliver())
+
+    async def _deliver(self):
+        try:
+            while self._batches:
+                try:
+                    await self.handler(self._batches.popleft())
+                except Exception as exception:
+                    _report(self.loop, exception)
+        finally:
+            self._task = None
+
+    async def flush(self):
+        """Hand over what was collected and wait until every batch is handled"""
+
+        self._flush()
+
+        if self._task is not None:
+            await self._task
+
+
+class HandlerScheduler:
+    """Runs the handlers of one event with at most concurrency of them at a time
+
+    Calls over the limit wait in a queue of maxsize. When it is full, overflow
+    decides what happens to the next call:
+
+    - drop: the new call is discarded
+    - drop_oldest: the oldest waiting call is discarded
+
+    The packet processor never waits on handlers, so slow handlers can't
+    hold up reading the socket and the heartbeats with it.
+    """
+
+    DROP = 'drop'
+    DROP_OLDEST = 'drop_oldest'
+
+    def __init__(self, loop, event, concurrency, maxsize, overflow, metrics, client_id):
+        if overflow not in (self.DROP, self.DROP_OLDEST):
+            raise ValueError('Unknown overflow policy: {}'.format(overflow))
+
+        self.loop = loop
+        self.event = event
+        self.concurrency = concurrency
+        self.maxsize = maxsize
+        self.overflow = overflow
+
+        self._metrics = metrics
+        self._client_id = client_id
+
+        # Metric names, built once
+        self._depth_metric = 'handler.{}.queue_depth'.format(event)
+        self._latency_metric = 'handler.{}.latency'.format(event)
+
+        # (listener, args, kwargs) waiting for a free slot
+        self._pending = deque()
+        self.running = 0
+
+        # Metrics
+        self.high_water = 0
+        self.dropped = 0
+        self.completed = 0
+
+    def add(self, listener, args, kwargs):
+        if self.running < self.concurrency:
+            return self._start(listener, args, kwargs)
+
+        if len(self._pending) >= self.maxsize:
+            self.dropped += 1
+
+            if self.overflow == self.DROP:
+                return None
+
+            self._pending.popleft()
+
+        self._pending.append((listener, args, kwargs))
+
+        if len(self._pending) > self.high_water:
+            self.high_water = len(self._pending)
+
+        self._metrics.record(self._depth_metric, len(self._pending), self._client_id)
+
+    def _start(self, listener, args, kwargs):
+        self.running += 1
+        return self.loop.create_task(self._run(listener, args, kwargs))
+
+    async def _run(self, listener, args, kwargs):
+        start = perf_counter()
+
+        try:
+            await listener(*args, **kwargs)
+        except Exception as exception:
+            _report(self.loop, exception)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._metrics.record(self._latency_metric, perf_counter() - start, self._client_id)
+
+        # Not reached when cancelled, nothing new starts during shutdown
+        self._next()
+
+    def _next(self):
+        if self._pending:
+            self._start(*self._pending.popleft())
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'pending': len(self._pending),
+            'high_water': self.high_water,
+            'dropped': self.dropped,
+            'completed': self.completed
+        }
+
+
+class Event:
+    """An event read from an EventStream, args are what on_<name> would get"""
+
+    __slots__ = ('name', 'args')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    @property
+    def data(self):
+        """The first argument, e.g. the Message of a message event"""
+
+        return self.args[0] if self.args else None
+
+    def __repr__(self):
+        return '<Event name={self.name!r} data={self.data!r}>'.format(self=self)
+
+
+def get_event_location(state, args):
+    """Return the guild and channel id an event happened in, None when unknown"""
+
+    if not args:
+        return None, None
+
+    data = args[-1]
+
+    if isinstance(data, Message):
+        return (data.guild.id if data.guild is not None else None), data.channel.id
+
+    if isinstance(data, IChannel):
+        guild = state._channel_guilds.get(data.id)
+        return (guild.id if guild is not None else None), data.id
+
+    if isinstance(data, Guild):
+        return data.id, None
+
+    # Raw payloads
+    if isinstance(data, dict):
+        guild_id = data.get('guild_id')
+        channel_id = data.get('channel_id')
+
+        return (
+            int(guild_id) if guild_id is not None else None,
+            int(channel_id) if channel_id is not None else None
+        )
+
+    return None, None
+
+
+class EventStream:
+    """Events of the given names buffered for a consumer that pulls them
+
+    Events outside of guild_id or channel_id are filtered out before they are
+    queued. When maxsize events are waiting, overflow decides what happens
+    to the next one:
+
+    - drop: the new event is discarded
+    - drop_oldest: the oldest waiting event is discarded
+
+    A consumer that can't keep up loses events, it never holds up the packet
+    processor, as that would stop the heartbeats from being read too.
+    Close the stream (or use it with async with) when done.
+    """
+
+    DROP = 'drop'
+    DROP_OLDEST = 'drop_oldest'
+
+    def __init__(self, client, names, guild_id=None, channel_id=None, maxsize=EVENT_STREAM_SIZE, overflow=DROP):
+        if not names:
+            raise ValueError('At least one event name is required')
+
+        if overflow not in (self.DROP, self.DROP_OLDEST):
+            raise ValueError('Unknown overflow policy: {}'.format(overflow))
+
+        self._client = client
+        self.names = frozenset(names)
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.closed = False
+
+        # Metrics
+        self.high_water = 0
+        self.dropped = 0
+
+        self._items = deque()
+        self._getter = None
+
+    def __len__(self):
+        return len(self._items)
+
+    def _matches(self, args):
+        if self.guild_id is None and self.channel_id is None:
+            return True
+
+        guild_id, channel_id = get_event_location(self._client._connection, args)
+
+        if self.guild_id is not None and guild_id != self.guild_id:
+            return False
+
+        return self.channel_id is None or channel_id == self.channel_id
+
+    def put(self, name, args):
+        if self.closed or name not in self.names or not self._matches(args):
+            return None
+
+        if len(self._items) >= self.maxsize:
+            self.dropped += 1
+
+            if self.overflow == self.DROP:
+                return None
+
+            self._items.popleft()
+
+        self._items.append(Event(name, args))
+
+        if len(self._items) > self.high_water:
+            self.high_water = len(self._items)
+
+        if self._getter is not None and not self._getter.done():
+            self._getter.set_result(None)
+
+    async def _wait(self):
+        while not self._items and not self.closed:
+            self._getter = get_running_loop().create_future()
+            await self._getter
+
+    async def get(self):
+        """Return the next Event, None once the stream is closed and empty"""
+
+        await self._wait()
+
+        if not self._items:
+            return None
+
+        return self._items.popleft()
+
+    async def get_many(self, limit=None):
+        """Wait for at least one Event and return up to limit of them, [] once closed"""
+
+        await self._wait()
+
+        count = len(self._items) if limit is None else min(limit, len(self._items))
+        return [self._items.popleft() for _ in range(count)]
+
+    def close(self):
+        """Stop receiving events, what is already queued can still be read"""
+
+        if self.closed:
+            return None
+
+        self.closed = True
+        self._client._remove_stream(self)
+
+        if self._getter is not None and not self._getter.done():
+            self._getter.set_result(None)
+
+    def stats(self):
+        return {
+            'pending': len(self._items),
+            'high_water': self.high_water,
+            'dropped': self.dropped
+        }
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.get()
+
+        if event is None:
+            raise StopAsyncIteration
+
+        return event
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
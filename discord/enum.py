@@ -21,6 +21,7 @@ from enum import (
     auto,
     Enum,
     IntEnum,
+    IntFlag,
 )
 
 
@@ -68,3 +69,20 @@ class GatewayEvent(str, EnumerableEnum):
     SESSIONS_REPLACE = 'SESSIONS_REPLACE'
     READY_SUPPLEMENTAL = 'READY_SUPPLEMENTAL'
     GUILD_MEMBERS_CHUNK = 'GUILD_MEMBERS_CHUNK'
+
+
+class Capabilities(IntFlag):
+    """Gateway capabilities sent on IDENTIFY, each one changes the shape of the payloads"""
+
+    LAZY_USER_NOTES = 1 << 0
+    NO_AFFINE_USER_IDS = 1 << 1
+    VERSIONED_READ_STATES = 1 << 2
+    VERSIONED_USER_GUILD_SETTINGS = 1 << 3
+    DEDUPE_USER_OBJECTS = 1 << 4
+    PRIORITIZED_READY_PAYLOAD = 1 << 5
+    MULTIPLE_GUILD_EXPERIMENT_POPULATIONS = 1 << 6
+    NON_CHANNEL_READ_STATES = 1 << 7
+    AUTH_TOKEN_REFRESH = 1 << 8
+    USER_SETTINGS_PROTO = 1 << 9
+    CLIENT_STATE_V2 = 1 << 10
+    PASSIVE_GUILD_UPDATE = 1 << 11
@@ -24,14 +24,29 @@ from .util import (
     minutes_elapsed_timestamp
 )
 
+from typing import Optional
+from functools import cached_property
+
+from msgspec import (
+    Raw,
+    field,
+    Struct
+)
+
+from msgspec.json import Decoder
 
 from asyncio import (
+    gather,
     wait_for,
     TimeoutError
 )
-from logging import getLogger
+from logging import (
+    DEBUG,
+    getLogger
+)
 
 from zlib import decompressobj
+from time import perf_counter
 
 
 from .constants import (
@@ -44,6 +59,8 @@ from .enum import (
     GatewayEvent
 )
 
+from .capture import FrameWriter
+from .ingest import IngestQueue
 from .subscriber import GuildSubscriber
 from .ratelimit import GatewayRatelimiter
 from .keepalive import AsyncKeepaliveHandler
@@ -51,19 +68,17 @@ from .keepalive import AsyncKeepaliveHandler
 _log = getLogger(__name__)
 
 
-class DiscordPacket:
-    __slots__ = (
-        'code',
-        'sequence',
-        'event',
-        'data'
-    )
+class DiscordPacket(Struct, dict=True):
+    """The gateway envelope, the payload is only decoded when accessed"""
 
-    def __init__(self, data):
-        self.code = data['op']
-        self.sequence = data['s'] if 's' in data.keys() else None
-        self.event = data['t'] if 't' in data.keys() else None
-        self.data = data['d'] if 'd' in data.keys() else None
+    code: int = field(name='op')
+    sequence: Optional[int] = field(default=None, name='s')
+    event: Optional[str] = field(default=None, name='t')
+    raw: Raw = field(default=Raw(b'null'), name='d')
+
+    @cached_property
+    def data(self):
+        return from_json(self.raw)
 
     def __str__(self):
         return 'code={self.code}, sequence={self.sequence}, event={self.event}, data={self.data}'.format(self=self)
@@ -85,26 +100,71 @@ class DiscordWebsocket:
         self.id = client._connection.id
         self.token = client._connection.token
         self.device = client._connection.device
-        self.uri = self._get_gatway_uri(parameters)
+        self.default_gateway = client._connection.gateway or self.DEFAULT_GATEWAY
+        self.uri = parameters.get('uri', self.default_gateway)
 
+        self._websocket = None
         self._guild_subscriber = None
         self._rate_limiter = GatewayRatelimiter()
 
         # Client connection parsers
         self._keep_alive = None
         self._parsers = client._connection.parsers
+        self._event_consumers = client._connection.EVENT_CONSUMERS
 
         # Max timeout after not receiving anything
         self._max_heartbeat_timeout = client._connection.heartbeat_timeout
 
+        # Large frames are handed to a worker thread
+        self._executor = client._connection.executor
+        self._offload_threshold = client._connection.offload_threshold
+
+        # Record the raw frames when capturing
+        self._capture = client._connection.capture
+
+        # Heartbeat and blocked time statistics, kept across reconnects, and the sink they are reported to
+        self._latency_stats = client._connection.latency_stats
+        self._loop_stats = client._connection.loop_stats
+        self._metrics = client._connection.metrics
+
+        # Checkpoints the session, and what changed the state, so it can be resumed after a restart
+        self._session_store = client._connection.session_store
+        self._journaled_events = client._connection.JOURNALED_EVENTS
+
+        # Guilds we already have, advertised on IDENTIFY
+        self._guild_cache = client._connection.guild_cache
+
+        # Capabilities advertised on IDENTIFY and the size of the READY they got us
+        self._capabilities = client._connection.capabilities
+        self.ready_bytes = 0
+
+        # Received packets wait here until they are processed
+        self.ingest = IngestQueue(
+            maxsize=client._connection.ingest_queue_size,
+            overflow=client._connection.ingest_overflow,
+            packet_type=DiscordPacket,
+            metrics=self._metrics,
+            client_id=self.id
+        )
+
         # Previous state(If its set)
         self._initial = parameters['initial']
         self.resume_set = parameters.get('resume', False)
         self.sequence = parameters.get('sequence', None)
         self.session_id = parameters.get('session', None)
 
+        # Resolved with the event name once READY or RESUMED is received
+        self.handshake = self.loop.create_future()
+
         # Setup the buffers to process messages
         self._reset_buffer()
+        self._decoder = Decoder(DiscordPacket)
+
+        # Reused by the hot path, so we don't build it for every frame
+        self._log_extra = {
+            'className': self.__class__.__name__,
+            'clientId': self.id,
+        }
 
         # Register the opcode routes
         self.op_code_routes = {
@@ -116,6 +176,11 @@ class DiscordWebsocket:
             GatewayOpcode.INVALIDATE_SESSION.value: self.process_invalidate_session,
         }
 
+        # Routes that run after the parser, with what it returned
+        self.parsed_routes = {
+            GatewayEvent.READY.value: self.process_ready_guilds
+        }
+
         # Register the event routes
         self.event_routes = {
             GatewayEvent.READY.value: self.process_ready,
@@ -129,17 +194,18 @@ class DiscordWebsocket:
         self._zlib = decompressobj()
         self._buffer = bytearray()
 
-    def _get_gatway_uri(self, parameters):
+    def _get_gatway_uri(self):
         # Set the encoding, compresison options
         options = '/?encoding=json&v={version}&compress=zlib-stream'.format(
             version=self.API_VERSION
         )
 
-        return parameters.get('uri', self.DEFAULT_GATEWAY) + options
+        # The options are only added here, self.uri is passed on to the next connection
+        return self.uri + options
 
     def _get_connection(self):
         return Connect(
-            uri=self.uri,
+            uri=self._get_gatway_uri(),
             user_agent_header=self.device.headers['browser_user_agent'],
             **WEBSOCKET_CONFIGURATION
         )
@@ -191,8 +257,26 @@ class DiscordWebsocket:
         if self._guild_subscriber is not None:
             self._guild_subscriber['task'].cancel()
 
+        # Not connected yet
+        if self._websocket is None:
+            return None
+
         return await self._websocket.close(code=code)
 
+    async def _stop_tasks(self):
+        """Cancel the keepalive and subscriber tasks and wait until they are done"""
+
+        tasks = [
+            entry['task']
+            for entry in (self._keep_alive, self._guild_subscriber)
+            if entry is not None
+        ]
+
+        for task in tasks:
+            task.cancel()
+
+        await gather(*tasks, return_exceptions=True)
+
     async def request_guild_members(self, guild_id):
         payload = {
             'op': GatewayOpcode.REQUEST_MEMBERS.value,
@@ -204,6 +288,12 @@ class DiscordWebsocket:
         }
         await self.send(payload)
 
+    def _get_guild_hashes(self):
+        if self._guild_cache is None:
+            return {}
+
+        return self._guild_cache.hashes(self.id)
+
     async def identify(self):
         """Send identify packet to websocket"""
 
@@ -211,12 +301,12 @@ class DiscordWebsocket:
             'op': GatewayOpcode.IDENTIFY.value,
             'd': {
                 'token': self.token,
-                'capabilities': 1021,
+                'capabilities': int(self._capabilities),
                 'properties': {**self.device.headers},
                 'compress': False,
                 # Need to research
                 'client_state': {
-                    'guild_hashes': {},
+                    'guild_hashes': self._get_guild_hashes(),
                     'highest_last_message_id': '0',
                     'read_state_version': 0,
                     'user_guild_settings_version': -1,
@@ -318,8 +408,11 @@ class DiscordWebsocket:
         self.sequence = None
         self.session_id = None
 
+        if self._session_store is not None:
+            self._session_store.delete(self.id)
+
         # Set the uri to the default
-        self.uri = self.DEFAULT_GATEWAY
+        self.uri = self.default_gateway
 
         # Close keepalive
         await self.close(code=1000)
@@ -336,13 +429,22 @@ class DiscordWebsocket:
         await self.close()
         raise ReconnectWebSocket
 
+    def _set_handshake(self, event):
+        if not self.handshake.done():
+            self.handshake.set_result(event)
+
     async def process_ready(self, packet):
         self.session_id = packet.data['session_id']
         self.uri = packet.data['resume_gateway_url']
+        self._set_handshake(packet.event)
+
+        self.ready_bytes = len(packet.raw)
+        self._metrics.record('ready.bytes', self.ready_bytes, self.id)
 
         _log.info(
-            'Connected to Gateway session_id=%s',
+            'Connected to Gateway session_id=%s, ready_bytes=%d',
             self.session_id,
+            self.ready_bytes,
             extra={
                 'className': self.__class__.__name__,
                 'clientId': self.id,
@@ -353,12 +455,29 @@ class DiscordWebsocket:
 
         await self.change_presence()
 
-        # Register the guilds and subscribe
-        guilds = packet.data['guilds']
+    async def process_ready_guilds(self, guilds):
+        """Subscribe to the guilds parse_ready returned, complete even when READY was partial"""
+
+        if guilds is None:
+            _log.warning(
+                'READY has a partial guild that is not in the GuildCache, identifying again',
+                extra={
+                    'className': self.__class__.__name__,
+                    'clientId': self.id,
+                }
+            )
+
+            # process_ready already moved us to the resume_gateway_url, IDENTIFY on the default
+            self.uri = self.default_gateway
+
+            await self.close()
+            raise ReconnectWebSocket(resume=False)
 
         self._guild_subscriber = self._get_guild_subscriber(guilds)
 
     async def process_resumed(self, packet):
+        self._set_handshake(packet.event)
+
         _log.info(
             'Successfully RESUMED session_id=%s',
             self.session_id,
@@ -392,7 +511,7 @@ class DiscordWebsocket:
                 }
             )
 
-            self._keep_alive['handler'].send_heartbeat()
+            return await self._keep_alive['handler'].send_heartbeat()
 
         # Just acknowlege the heartbeat
         return self._keep_alive['handler'].ack()
@@ -408,69 +527,144 @@ class DiscordWebsocket:
 
         return await self.resume()
 
+    def _add_blocked_time(self, start):
+        elapsed = perf_counter() - start
+
+        self._loop_stats.add(elapsed)
+        self._metrics.record('loop.blocked', elapsed, self.id)
+
     def dispatch_client_event(self, packet):
         try:
             func = self._parsers[packet.event]
         except KeyError:
-            return _log.debug(
-                'Unknown event, seq=%d, event=%s',
-                self.sequence,
-                packet.event,
-                extra={
-                    'className': self.__class__.__name__,
-                    'clientId': self.id,
-                }
-            )
+            # Unknown or unhandled event, the payload is never decoded
+            if _log.isEnabledFor(DEBUG):
+                _log.debug(
+                    'Ignoring event, seq=%s, event=%s',
+                    self.sequence,
+                    packet.event,
+                    extra=self._log_extra
+                )
+
+            return None
 
-        return func(packet.data)
+        start = perf_counter()
+
+        try:
+            return func(packet.data)
+        finally:
+            self._add_blocked_time(start)
 
     async def process_dispatch(self, packet):
-        event = packet.event
+        route = self.event_routes.get(packet.event)
+
+        if route is not None:
+            start = perf_counter()
+
+            # Decoded before the route, the parser reuses it
+            packet.data
+            self._add_blocked_time(start)
 
-        if event in GatewayEvent.values():
-            await self.event_routes[event](packet)
+            await route(packet)
 
-        return self.dispatch_client_event(packet)
+        result = self.dispatch_client_event(packet)
 
-    async def handle_dispatch_route(self, message):
-        packet = DiscordPacket(message)
-        op_code = packet.code
+        parsed_route = self.parsed_routes.get(packet.event)
 
+        if parsed_route is not None:
+            return await parsed_route(result)
+
+        return result
+
+    async def handle_dispatch_route(self, packet):
         if packet.sequence is not None:
             self.sequence = packet.sequence
 
-        if self._keep_alive:
-            self._keep_alive['handler'].tick()
+            if self._session_store is not None and self.session_id is not None:
+                # Recorded before the sequence, a saved sequence never skips a state change
+                if packet.event in self._journaled_events:
+                    self._session_store.record(self.id, packet.event, packet.data)
+
+                self._session_store.update(self.id, self.uri, self.session_id, self.sequence)
 
-        if op_code in GatewayOpcode.values():
-            await self.op_code_routes[op_code](packet)
+        route = self.op_code_routes.get(packet.code)
+
+        if route is not None:
+            await route(packet)
 
     def received_message(self, data):
-        self._buffer.extend(data)
-        data_length = len(data)
+        if _log.isEnabledFor(DEBUG):
+            data_length = len(data)
+            _log.debug(
+                'Processing %d byte%s',
+                data_length,
+                's' if data_length > 1 else '',
+                extra=self._log_extra
+            )
 
-        _log.debug(
-            'Processing %d byte%s',
-            data_length,
-            's' if data_length > 1 else '',
-            extra={
-                'className': self.__class__.__name__,
-                'clientId': self.id,
-            }
-        )
+        # A complete message in a single frame, inflate it without copying
+        if not self._buffer:
+            if not data.endswith(ZLIB_SUFFIX):
+                self._buffer.extend(data)
+                return None
+
+            return self._decoder.decode(self._zlib.decompress(data))
 
-        if data_length < 4 or data[-4:] != ZLIB_SUFFIX:
+        # Fragmented message, accumulate until we see the flush suffix
+        self._buffer.extend(data)
+
+        if not self._buffer.endswith(ZLIB_SUFFIX):
             return None
 
         data = self._zlib.decompress(self._buffer)
-        self._buffer = bytearray()
 
-        return from_json(data)
+        # Keep the same buffer object around for the next fragmented message
+        self._buffer.clear()
+
+        return self._decoder.decode(data)
+
+    def _received_large_message(self, data):
+        """Inflate and decode the envelope and payload, runs in the executor"""
+
+        message = self.received_message(data)
+
+        # Decode the payload here as well, the cached result is used on the loop
+        if message is not None:
+            message.data
+
+        return message
+
+    async def receive(self, data):
+        """Inflate and decode a frame, in the executor if it is large
+
+        Only the inflate releases the GIL and runs in parallel with the loop,
+        the JSON decode holds it and mostly saves the loop a few iterations.
+        The parsers (parse_ready being the largest) always run on the loop.
+        """
+
+        threshold = self._offload_threshold
+
+        if threshold is not None and len(self._buffer) + len(data) >= threshold:
+            self._loop_stats.offloaded += 1
+
+            # Awaited before the next recv, so the zlib stream and ordering are kept
+            return await self.loop.run_in_executor(
+                self._executor,
+                self._received_large_message,
+                data
+            )
+
+        start = perf_counter()
+
+        try:
+            return self.received_message(data)
+        finally:
+            self._add_blocked_time(start)
 
     def raise_or_handle(self, exception):
         can_handle_exceptions = (
             'TimeoutError',
-            'WebsocketClosedOk'
+            'ConnectionClosedOK',
             'IncompleteReadError',
             'ConnectionClosedError'
         )
@@ -484,6 +678,76 @@ class DiscordWebsocket:
         # We cannot handle this Exception so we raise it
         raise exception
 
+    def _is_critical(self, packet):
+        """Only events that do nothing but reach client handlers can be dropped"""
+
+        if packet.event in self.event_routes:
+            return True
+
+        return packet.event in self._parsers and packet.event not in self._event_consumers
+
+    async def receive_frames(self):
+        """Read the socket and queue the decoded dispatches, never waits on processing
+
+        Everything else (heartbeats, RECONNECT, INVALIDATE_SESSION) is handled
+        right away, so it doesn't wait behind the backlog of dispatches.
+        """
+
+        writer = FrameWriter(self._capture) if self._capture else None
+
+        try:
+            while self._websocket.open:
+                try:
+                    data = await wait_for(
+                        self._websocket.recv(),
+                        timeout=self._max_heartbeat_timeout
+                    )
+                except Exception as exception:
+                    return self.raise_or_handle(exception)
+
+                if self._keep_alive:
+                    self._keep_alive['handler'].tick()
+
+                if writer is not None:
+                    writer.write(data)
+
+                message = await self.receive(data)
+
+                # Waiting for the rest of a fragmented message
+                if message is None:
+                    continue
+
+                if message.code != GatewayOpcode.DISPATCH.value:
+                    try:
+                        await self.handle_dispatch_route(message)
+                    except Exception as exception:
+                        return self.raise_or_handle(exception)
+
+                    continue
+
+                await self.ingest.put(message, critical=self._is_critical(message))
+        finally:
+            if writer is not None:
+                writer.close()
+
+            # Let the processor drain what is left
+            self.ingest.close()
+
+    async def process_packets(self):
+        """Handle the queued dispatches in order until the receiver stops"""
+
+        while True:
+            packet = await self.ingest.get()
+
+            if packet is None:
+                return None
+
+            try:
+                await self.handle_dispatch_route(packet)
+            except Exception as exception:
+                # Routes send as well, the connection can drop while they do
+                return self.raise_or_handle(exception)
+
     async def poll(self):
         self._websocket = await self._get_connection()
         _log.debug(
@@ -495,14 +759,16 @@ class DiscordWebsocket:
             }
         )
 
-        while self._websocket.open:
-            try:
-                data = await wait_for(
-                    self._websocket.recv(),
-                    timeout=self._max_heartbeat_timeout
-                )
-            except Exception as exception:
-                return self.raise_or_handle(exception)
+        receiver = self.loop.create_task(self.receive_frames())
 
-            message = self.received_message(data)
-            await self.handle_dispatch_route(message)
+        try:
+            await self.process_packets()
+        except BaseException:
+            receiver.cancel()
+            raise
+        finally:
+            # Not closed by us when the connection dropped
+            await self._stop_tasks()
+
+        # Everything received has been processed, raise whatever stopped the receiver
+        return await receiver
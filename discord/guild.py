@@ -25,6 +25,16 @@ from .channel import channel_factory
 
 @dataclass
 class Role:
+    __slots__ = (
+        'id',
+        'name',
+        'hoist',
+        'version',
+        'position',
+        'permissions',
+        'mentionable',
+    )
+
     id: int
     name: str
     hoist: bool
@@ -35,9 +45,12 @@ class Role:
 
     def __init__(self, data):
         self.id = int(data['id'])
+        self._update(data)
+
+    def _update(self, data):
         self.name = data['name']
         self.hoist = data['hoist']
-        self.version = data['version']
+        self.version = data.get('version', 0)
         self.position = data['position']
         self.mentionable = data['mentionable']
         self.permissions = int(data['permissions'])
@@ -48,6 +61,16 @@ class Role:
 
 @dataclass
 class Guild:
+    __slots__ = (
+        '_state',
+        'id',
+        'name',
+        'icon',
+        'banner',
+        'roles',
+        'channels',
+    )
+
     id: int
     name: str
     icon: str
@@ -57,38 +80,78 @@ class Guild:
 
     def __init__(self, state, data):
         self._state = state
+        self.id = int(data['id'])
+        self.roles = {}
         self._update(data)
 
+        # Create and add all the relevant channels, threads are kept with them
+        self.channels = {}
+        self._add_channels(data['channels'])
+        self._add_channels(data.get('threads', ()))
+
     def _update(self, data):
-        self.id = int(data['id'])
         self.name = data['name']
         self.icon = data['icon']
         self.banner = data['banner']
 
-        # Add all the roles
-        self.roles = self._add_roles(data['roles'])
+        # Roles are updated in place, GUILD_UPDATE carries all of them
+        if 'roles' in data:
+            self._sync_roles(data['roles'])
+
+    def _sync_roles(self, roles):
+        role_ids = {self._add_role_from(role).id for role in roles}
 
-        # Create and add all the relevant channels
-        self.channels = self._add_channels(data['channels'])
+        for role_id in [role_id for role_id in self.roles if role_id not in role_ids]:
+            self._remove_role(role_id)
 
-    def _add_roles(self, roles):
-        return {role['id']: self._add_role_from(role) for role in roles}
+    def _sync_channels(self, channels):
+        """Updates the cached channels in place, the ones that are gone are removed with their messages"""
+
+        channel_ids = set()
+
+        for data in channels:
+            channel = self.channels.get(int(data['id']))
+
+            if channel is None:
+                channel = self._add_channel_from_data(data)
+            else:
+                channel._update(data)
+
+            channel_ids.add(channel.id)
+
+        for channel_id in [channel_id for channel_id in self.channels if channel_id not in channel_ids]:
+            self._state._remove_channel(channel_id)
 
     def _add_channels(self, channels):
-        return {channel['id']: self._add_channel_from_data(channel) for channel in channels}
+        for channel in channels:
+            self._add_channel_from_data(channel)
 
     def _add_role_from(self, data):
+        """Adds the role or updates the cached one in place"""
+
+        role = self.roles.get(int(data['id']))
+
+        if role is not None:
+            role._update(data)
+            return role
+
         role = Role(data)
+        self.roles[role.id] = role
         self._state._roles[role.id] = role
 
         return role
 
+    def _remove_role(self, role_id):
+        self._state._roles.pop(role_id, None)
+        return self.roles.pop(role_id, None)
+
     def _add_channel_from_data(self, data):
         channel = channel_factory(
             state=self._state,
             data=data
         )
 
-        # Add the channel to the state
-        self._state._channels[channel.id] = channel
+        # Add the channel to the guild, the state and its indexes
+        self.channels[channel.id] = channel
+        self._state._add_channel(channel, guild=self)
         return channel
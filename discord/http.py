@@ -22,117 +22,188 @@ from aiohttp import (
     ClientSession
 )
 
-from .util import (
-    to_json,
-    from_json
-)
+from msgspec.json import Decoder
+
+from .util import to_json
 
-from .constants import HTTP_API_URL
+from .constants import (
+    HTTP_API_URL,
+    DNS_CACHE_TTL,
+    MAX_SIZE_POOL,
+    MAX_SIZE_POOL_PER_HOST,
+    KEEPALIVE_TIMEOUT,
+    ESTABLISHED_CONNECTION_TIMEOUT
+)
 from .ratelimit import HTTPRatelimiter
 
 from urllib.parse import quote as _uriquote
 
 
 class Route:
+    # Parameters that split a rate limit bucket
+    MAJOR_PARAMETERS = ('channel_id', 'guild_id', 'webhook_id')
+
+    # path -> url template, built once per path
+    _templates = {}
 
     def __init__(self, method, path, **parameters):
         self.path = path
         self.method = method
 
-        url = HTTP_API_URL + self.path
+        # Identifies the route for the rate limiter
+        self.key = (method, path)
+        self.major = None
+
+        for name in self.MAJOR_PARAMETERS:
+            if name in parameters:
+                self.major = str(parameters[name])
+                break
+
+        template = self._templates.get(path)
+
+        if template is None:
+            template = self._templates[path] = HTTP_API_URL + path
+
+        if not parameters:
+            self.url: str = template
+            return None
+
+        # parameters is our own copy, quote the strings in place
+        for key, value in parameters.items():
+            if isinstance(value, str):
+                parameters[key] = _uriquote(value)
+
+        self.url: str = template.format_map(parameters)
+
+
+def create_session(pool_size=MAX_SIZE_POOL, pool_size_per_host=MAX_SIZE_POOL_PER_HOST,
+                   keepalive_timeout=KEEPALIVE_TIMEOUT):
+    """Return a ClientSession that keeps its connections alive
+
+    Pass it as Client(http_session=...) to share the pool and the DNS cache
+    between clients. It has to be created in a running event loop, and
+    closed by whoever created it once every client is closed.
+    """
+
+    connector = TCPConnector(
+        ttl_dns_cache=DNS_CACHE_TTL,
+        limit=pool_size,
+        limit_per_host=pool_size_per_host,
+        keepalive_timeout=keepalive_timeout
+    )
 
-        if parameters:
-            url = url.format_map({k: _uriquote(v) if isinstance(
-                v, str) else v for k, v in parameters.items()})
+    timeout = ClientTimeout(
+        total=None,
+        connect=None,
+        sock_read=None,
+        sock_connect=ESTABLISHED_CONNECTION_TIMEOUT
+    )
 
-        self.url: str = url
+    return ClientSession(connector=connector, timeout=timeout)
 
 
 class HTTPClient:
-    DNS_CACHE_TTL = 300
-    MAX_SIZE_POOL = 10
-    ESTABLISHED_CONNECTION_TIMEOUT = 1800.0
 
-    def __init__(self, client):
+    def __init__(self, client, **options):
         self.id = None
         self.loop = client.loop
         self.client = client
 
         self._limiter = HTTPRatelimiter(id=self.id)
-        self.__session = self.get_aiohttp_session()
-
-    def get_aiohttp_client_timeout(self):
-        return ClientTimeout(
-            total=None,
-            connect=None,
-            sock_read=None,
-            sock_connect=self.ESTABLISHED_CONNECTION_TIMEOUT
-        )
 
-    def get_aiohttp_connector(self):
-        return TCPConnector(
-            loop=self.loop,
-            ttl_dns_cache=self.DNS_CACHE_TTL,
-            force_close=True,
-            limit=self.MAX_SIZE_POOL
-        )
+        # Connection pool limits, only used when we create the session ourselves
+        self.pool_size = options.get('http_pool_size', MAX_SIZE_POOL)
+        self.pool_size_per_host = options.get('http_pool_size_per_host', MAX_SIZE_POOL_PER_HOST)
+        self.keepalive_timeout = options.get('http_keepalive_timeout', KEEPALIVE_TIMEOUT)
 
-    def get_aiohttp_session(self):
-        return ClientSession(
-            loop=self.loop,
-            connector=self.get_aiohttp_connector(),
-            timeout=self.get_aiohttp_client_timeout()
-        )
+        # A session shared with other clients is left open on close()
+        self.__session = options.get('http_session', None)
+        self._owns_session = self.__session is None
+
+        # The headers every request sends, built on the first request
+        self._headers = None
+        self._decoder = Decoder()
+
+    def _get_session(self):
+        # Created on first use so it belongs to the running loop
+        if self.__session is None:
+            self.__session = create_session(
+                pool_size=self.pool_size,
+                pool_size_per_host=self.pool_size_per_host,
+                keepalive_timeout=self.keepalive_timeout
+            )
+
+        return self.__session
+
+    async def close(self):
+        """Close the underlying aiohttp session, unless it is shared"""
+
+        if self._owns_session and self.__session is not None:
+            await self.__session.close()
+
+            # A request after a reconnect opens a new session
+            self.__session = None
 
     def _can_handle_code(self, code):
         return code in (200, 204, 429)
 
-    async def _do_request_cycle(self, method, url, **kwargs):
+    async def _do_request_cycle(self, route, method, url, **kwargs):
         method = method.lower()
 
         # Get the method from aiohttp session
-        func = getattr(self.__session, method)
+        func = getattr(self._get_session(), method)
 
         while True:
+            bucket = await self._limiter.acquire(route)
 
-            async with self._limiter:
+            try:
                 response = await func(url, **kwargs)
+                body = await response.read()
+
+                self._limiter.update(route, bucket, response.headers)
+            finally:
+                bucket.release()
 
-                text = await response.text()
+            if response.status == 429:
+                self._limiter.set(bucket, self._decoder.decode(body), response.headers)
+                continue
 
-                if response.status == 429:
-                    self._limiter.set(from_json(text))
-                    continue
+            if not self._can_handle_code(response.status):
+                return body.decode(errors='replace')
 
-                if not self._can_handle_code(response.status):
-                    return text
+            if not body:
+                return None
 
-                if not text:
-                    return None
+            if response.status in (200, 204):
+                return self._decoder.decode(body)
 
-                if response.status in (200, 204):
-                    return from_json(text)
+    def _get_headers(self):
+        # The token and the device don't change for the lifetime of the state
+        if self._headers is None:
+            device = self.client._connection.device
+
+            self._headers = {
+                'user-agent': device.user_agent,
+                'x-super-properties': device.x_super_properties,
+                'authorization': self.client.token
+            }
+
+        return self._headers
 
     def request(self, route, **kwargs):
         method = route.method
         url = route.url
 
-        # Get the device properties used by the client
-        device = self.client._connection.device
-
-        headers = {
-            'user-agent': device.headers['browser_user_agent'],
-            'x-super-properties': device.x_super_properties,
-            'authorization': self.client.token
-        }
+        # aiohttp copies the headers, so the same dict is passed every time
+        headers = self._get_headers()
 
         if 'json' in kwargs:
-            headers['content-type'] = 'application/json'
+            headers = {**headers, 'content-type': 'application/json'}
             kwargs['data'] = to_json(kwargs.pop('json'))
 
         kwargs['headers'] = headers
 
-        return self._do_request_cycle(method, url, **kwargs)
+        return self._do_request_cycle(route, method, url, **kwargs)
 
     def history(self, channel):
         channel_id = str(channel.id)
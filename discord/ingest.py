@@ -0,0 +1,178 @@
+"""
+Copyright (C) [2024] [sepsemi]
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+
+from struct import Struct
+from collections import deque
+from tempfile import TemporaryFile
+from asyncio import get_running_loop
+
+from msgspec.json import (
+    Encoder,
+    Decoder
+)
+
+from .metrics import MetricsSink
+
+# Spilled packets are prefixed with their length
+LENGTH = Struct('<I')
+
+
+class IngestQueue:
+    """A bounded queue between the websocket receiver and the packet processor
+
+    There is exactly one producer and one consumer. When the queue is full,
+    overflow decides what happens to the next packet:
+
+    - block: the receiver waits until the processor catches up
+    - drop: non-critical packets are dropped, critical ones still block
+    - spill: packets are written to a temporary file and read back in order
+
+    A new high water mark, every drop and every spill are reported to metrics
+    as ingest.high_water, ingest.dropped and ingest.spilled.
+    """
+
+    BLOCK = 'block'
+    DROP = 'drop'
+    SPILL = 'spill'
+
+    def __init__(self, maxsize, overflow=BLOCK, packet_type=None, metrics=None, client_id=None):
+        if overflow not in (self.BLOCK, self.DROP, self.SPILL):
+            raise ValueError('Unknown overflow policy: {}'.format(overflow))
+
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.closed = False
+
+        self._metrics = metrics or MetricsSink()
+        self._client_id = client_id
+
+        # Metrics
+        self.high_water = 0
+        self.dropped = 0
+        self.spilled = 0
+
+        self._items = deque()
+        self._getter = None
+        self._putter = None
+
+        self._spill = None
+        self._spill_count = 0
+        self._spill_offset = 0
+        self._encoder = Encoder()
+        self._decoder = Decoder(packet_type) if packet_type is not None else None
+
+    def __len__(self):
+        return len(self._items) + self._spill_count
+
+    def _wake(self, waiter):
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _write_spill(self, item):
+        if self._spill is None:
+            self._spill = TemporaryFile()
+
+        data = self._encoder.encode(item)
+
+        self._spill.seek(0, 2)
+        self._spill.write(LENGTH.pack(len(data)))
+        self._spill.write(data)
+
+        self.spilled += 1
+        self._spill_count += 1
+        self._metrics.record('ingest.spilled', self.spilled, self._client_id)
+        self._wake(self._getter)
+
+    def _read_spill(self):
+        self._spill.seek(self._spill_offset)
+
+        length, = LENGTH.unpack(self._spill.read(LENGTH.size))
+        item = self._decoder.decode(self._spill.read(length))
+
+        self._spill_offset += LENGTH.size + length
+        self._spill_count -= 1
+
+        # Everything has been read back, start over at the beginning of the file
+        if self._spill_count == 0:
+            self._spill.truncate(0)
+            self._spill_offset = 0
+
+        return item
+
+    async def put(self, item, critical=False):
+        # Once spilling started, everything goes to disk to keep the order
+        if self._spill_count:
+            return self._write_spill(item)
+
+        if len(self._items) >= self.maxsize:
+            if self.overflow == self.SPILL:
+                return self._write_spill(item)
+
+            if self.overflow == self.DROP and not critical:
+                self.dropped += 1
+                self._metrics.record('ingest.dropped', self.dropped, self._client_id)
+                return None
+
+            while len(self._items) >= self.maxsize:
+                self._putter = get_running_loop().create_future()
+                await self._putter
+
+        self._items.append(item)
+
+        if len(self._items) > self.high_water:
+            self.high_water = len(self._items)
+            self._metrics.record('ingest.high_water', self.high_water, self._client_id)
+
+        self._wake(self._getter)
+
+    async def get(self):
+        """Return the next item, or None once the queue is closed and empty"""
+
+        while True:
+            if self._items:
+                item = self._items.popleft()
+                self._wake(self._putter)
+                return item
+
+            if self._spill_count:
+                return self._read_spill()
+
+            if self.closed:
+                return None
+
+            self._getter = get_running_loop().create_future()
+            await self._getter
+
+    def close(self):
+        """No more items will be put, the consumer drains what is left"""
+
+        self.closed = True
+        self._wake(self._getter)
+
+        if self._spill is not None and not self._spill_count:
+            self._spill.close()
+            self._spill = None
+
+    def stats(self):
+        return {
+            'pending': len(self),
+            'high_water': self.high_water,
+            'dropped': self.dropped,
+            'spilled': self.spilled
+        }
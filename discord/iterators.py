@@ -96,13 +96,6 @@ class SearchIterator:
         self.offset = 0
         self.processed = 0
 
-    def _get_context_route(self, value, context_id):
-        return Route(
-            'GET',
-            '/{value}/{context_id}/messages/search',
-            value=value,
-            context_id=context_id
-        )
 
     def _process_chunk(self, chunk):
         """Processes a chunk of messages"""
@@ -120,10 +113,17 @@ class SearchIterator:
     def _get_route(self):
         """Gets the correct route based on the guild being pressent of not"""
 
+        # Named after the major parameter, so every channel and guild is rate limited on its own
         if not self.guild:
-            return self._get_context_route('channels', self.channel.id)
+            return Route(
+                'GET', '/channels/{channel_id}/messages/search',
+                channel_id=self.channel.id
+            )
 
-        return self._get_context_route('guilds', self.guild.id)
+        return Route(
+            'GET', '/guilds/{guild_id}/messages/search',
+            guild_id=self.guild.id
+        )
 
     async def search(self, **kwargs):
         """Searches for messages from the specified parameters"""
@@ -35,6 +35,11 @@ class AsyncKeepaliveHandler:
         self.gateway = gateway
         self.interval = interval
 
+        # Shared by every connection of the client
+        self.stats = gateway._latency_stats
+        self.metrics = gateway._metrics
+        self.awaiting_ack = False
+
         self.latency = 0.0
         self.last_ack = perf_counter()
         self.last_send = perf_counter()
@@ -44,6 +49,7 @@ class AsyncKeepaliveHandler:
         self.msg = 'Gateway acknowledged heartbeat, sequence=%s'
         self.behind_msg = 'Gateway acknowledged late %.1fs behind'
         self.unresponsive_msg = 'has stopped responding to gateway, closing'
+        self.missed_msg = 'Gateway did not acknowledge the last heartbeat, %d in a row'
 
     def is_connected(self):
         """Check if the websocket connection is still open"""
@@ -58,6 +64,10 @@ class AsyncKeepaliveHandler:
 
         self.last_ack = ack_time
         self.latency = ack_time - self.last_send
+        self.awaiting_ack = False
+
+        self.stats.add(self.latency)
+        self.metrics.record('heartbeat.latency', self.latency, self.gateway.id)
 
         if self.latency > self.MAX_LATENCY:
             return _log.warning(
@@ -84,6 +94,19 @@ class AsyncKeepaliveHandler:
             'd': self.gateway.sequence
         }
 
+    def miss(self):
+        self.stats.miss()
+        self.metrics.record('heartbeat.missed', self.stats.missed, self.gateway.id)
+
+        _log.warning(
+            self.missed_msg,
+            self.stats.consecutive_missed,
+            extra={
+                'className': self.__class__.__name__,
+                'clientId': self.gateway.id,
+            }
+        )
+
     async def send_heartbeat(self):
         payload = self.get_payload()
 
@@ -104,7 +127,12 @@ class AsyncKeepaliveHandler:
                 # Close the gateway
                 return await self.gateway.close()
 
+            # The previous heartbeat was never acknowledged
+            if self.awaiting_ack:
+                self.miss()
+
             await self.send_heartbeat()
 
+            self.awaiting_ack = True
             self.last_send = perf_counter()
             await sleep(self.interval)
@@ -17,12 +17,7 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 
 
-from dataclasses import dataclass
-
-from .user import User
-from .guild import Guild
-from .channel import channel_factory
-
+from datetime import datetime
 from enum import IntEnum, auto
 
 
@@ -61,39 +56,156 @@ class MessageType(IntEnum):
 
 
 class PartialMessage:
+    __slots__ = (
+        'id',
+        'channel_id',
+    )
 
     def __init__(self, data):
         self.id = int(data['id'])
         self.channel_id = int(data['channel_id'])
 
 
-@dataclass
+# Marks a field that wasn't parsed yet, None is a valid value for most of them
+_UNSET = object()
+
+# The fields of the payload the properties parse, the rest is dropped once cached
+_FIELDS = (
+    'id',
+    'type',
+    'author',
+    'mentions',
+    'timestamp',
+    'edited_timestamp',
+    'embeds',
+    'attachments',
+)
+
+
+def _compact(data):
+    return {key: data[key] for key in _FIELDS if key in data}
+
+
 class Message:
-    id: int
-    type: MessageType
-    content: str
-    author: User
-    guild: Guild
-    channel: channel_factory
+    """A message that parses its fields from the raw payload on first access
+
+    Messages compare equal by id.
+    """
+
+    __slots__ = (
+        '_state',
+        '_data',
+        '_id',
+        '_type',
+        '_author',
+        '_mentions',
+        '_timestamp',
+        '_edited_timestamp',
+        'content',
+        'guild',
+        'channel',
+    )
 
     def __init__(self, guild, channel, data):
         self._state = channel._state
         self.guild = guild
         self.channel = channel
-        self.id = int(data['id'])
-        self.type = MessageType(data['type'])
-        self.author = self._get_author(data['author'])
-        self._update(data)
+        self._id = None
+        self._type = None
+        self._data = data
+        self.content = data['content']
+        self._clear_parsed()
+
+    def __repr__(self):
+        return 'Message(id={self.id}, channel={self.channel!r}, content={self.content!r})'.format(self=self)
+
+    def __eq__(self, other):
+        if not isinstance(other, Message):
+            return NotImplemented
+
+        return self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    @property
+    def id(self):
+        if self._id is None:
+            self._id = int(self._data['id'])
+        return self._id
+
+    @property
+    def type(self):
+        if self._type is None:
+            self._type = MessageType(self._data['type'])
+        return self._type
+
+    @property
+    def author(self):
+        if self._author is _UNSET:
+            self._author = self._get_author(self._data['author'])
+        return self._author
+
+    @property
+    def mentions(self):
+        if self._mentions is _UNSET:
+            self._mentions = [self._get_author(user) for user in self._data.get('mentions', ())]
+        return self._mentions
+
+    @property
+    def timestamp(self):
+        if self._timestamp is _UNSET:
+            self._timestamp = _parse_timestamp(self._data.get('timestamp'))
+        return self._timestamp
+
+    @property
+    def edited_timestamp(self):
+        if self._edited_timestamp is _UNSET:
+            self._edited_timestamp = _parse_timestamp(self._data.get('edited_timestamp'))
+        return self._edited_timestamp
+
+    @property
+    def embeds(self):
+        return self._data.get('embeds', [])
+
+    @property
+    def attachments(self):
+        return self._data.get('attachments', [])
 
     def _get_author(self, data):
-        return User(state=self._state, data=data)
+        return self._state.store_user(data)
 
     def _update(self, data):
+        # A new dict, so copies made before the update keep the old payload
+        data = {**self._data, **data}
+
         self.content = data['content']
+        self._data = _compact(data)
+        self._clear_parsed()
+
+    def _compact(self):
+        """Drop what the properties don't parse, called when the message is cached"""
+
+        self._data = _compact(self._data)
+
+    def _clear_parsed(self):
+        # Everything that can change is parsed again on access
+        self._author = _UNSET
+        self._mentions = _UNSET
+        self._timestamp = _UNSET
+        self._edited_timestamp = _UNSET
+
+
+def _parse_timestamp(value):
+    if value is None:
+        return None
+
+    return datetime.fromisoformat(value)
 
 
 def message_factory(guild, channel, data):
-    message = Message(guild=guild, channel=channel, data=data)
+    # Only regular messages, checked before anything is built
+    if data['type'] != MessageType.DEFAULT:
+        return None
 
-    if message.type == MessageType.DEFAULT:
-        return message
+    return Message(guild=guild, channel=channel, data=data)
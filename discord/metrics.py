@@ -0,0 +1,106 @@
+"""
+Copyright (C) [2024] [sepsemi]
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+
+from collections import deque
+
+
+class MetricsSink:
+    """Receives every metric the library records, does nothing by default
+
+    Subclass it and pass it as Client(metrics=...) to forward the values
+    to statsd, prometheus or a log.
+    """
+
+    def record(self, name, value, client_id):
+        return None
+
+
+class LatencyStats:
+    """Rolling heartbeat latency statistics for a single client"""
+
+    WINDOW = 100
+
+    def __init__(self, window=WINDOW):
+        self._samples = deque(maxlen=window)
+
+        self.last = 0.0
+        self.count = 0
+        self.missed = 0
+        self.consecutive_missed = 0
+
+    def add(self, latency):
+        self._samples.append(latency)
+
+        self.last = latency
+        self.count += 1
+        self.consecutive_missed = 0
+
+    def miss(self):
+        self.missed += 1
+        self.consecutive_missed += 1
+
+    def percentile(self, percent):
+        """Nearest-rank percentile over the rolling window"""
+
+        if not self._samples:
+            return 0.0
+
+        samples = sorted(self._samples)
+        index = max(0, -(-len(samples) * percent // 100) - 1)
+
+        return samples[int(index)]
+
+    def to_dict(self):
+        return {
+            'last': self.last,
+            'count': self.count,
+            'missed': self.missed,
+            'consecutive_missed': self.consecutive_missed,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': max(self._samples, default=0.0)
+        }
+
+
+class LoopStats:
+    """Time the gateway of a single client spent blocking the event loop
+
+    Covers inflating and decoding frames, decoding the payloads of routed
+    events, the parsers and the handlers that run inline. Handlers running
+    in a task of their own are not included.
+    """
+
+    def __init__(self):
+        self.blocked = 0.0
+        self.max_blocked = 0.0
+        self.offloaded = 0
+
+    def add(self, elapsed):
+        self.blocked += elapsed
+
+        if elapsed > self.max_blocked:
+            self.max_blocked = elapsed
+
+    def to_dict(self):
+        return {
+            'blocked': self.blocked,
+            'max_blocked': self.max_blocked,
+            'offloaded': self.offloaded
+        }
@@ -17,12 +17,20 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 
 
-from time import time
+from time import (
+    time,
+    monotonic
+)
+from random import uniform
 from logging import getLogger
+from weakref import WeakKeyDictionary
 
 from asyncio import (
     sleep,
-    Lock
+    shield,
+    Lock,
+    Semaphore,
+    get_running_loop
 )
 
 _log = getLogger(__name__)
@@ -73,53 +81,287 @@ class GatewayRatelimiter:
                 await sleep(delta)
 
 
+class HTTPBucket:
+    """The rate limit of one bucket, as last reported by the X-RateLimit headers"""
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset = 0.0
+        self.reset_after = 0.0
+        self.lock = Lock()
+
+        # Set once a response came back, with or without rate limit headers
+        self.known = False
+
+        # Resolved when the first request of the bucket is done
+        self.discovery = None
+
+        # The shared bucket this one was merged into, see HTTPRatelimiter.update
+        self.moved = None
+
+    def is_expired(self, current):
+        """Whether the window is over and nothing waits on the bucket, a new one would do the same"""
+
+        if self.lock.locked():
+            return False
+
+        if self.discovery is not None and not self.discovery.done():
+            return False
+
+        return current >= self.reset
+
+    def release(self):
+        """Called when a request of the bucket is done, whatever its outcome"""
+
+        if self.discovery is not None and not self.discovery.done():
+            self.discovery.set_result(None)
+
+    def get_delay(self):
+        """Reserve a request and return 0.0, or the seconds until the bucket resets"""
+
+        # A route without a rate limit
+        if self.remaining is None:
+            return 0.0
+
+        current = monotonic()
+
+        if self.remaining <= 0:
+            if current < self.reset:
+                return self.reset - current
+
+            # The bucket reset, assume a full new window until a response says otherwise
+            self.remaining = self.limit
+            self.reset = current + self.reset_after
+
+        self.remaining -= 1
+        return 0.0
+
+    def update(self, headers):
+        self.known = True
+        remaining = headers.get('X-RateLimit-Remaining')
+
+        if remaining is None:
+            return None
+
+        current = monotonic()
+        remaining = int(remaining)
+
+        # Responses of the same window can come back out of order, and the
+        # requests still in flight were already counted here
+        if self.remaining is not None and current < self.reset:
+            remaining = min(self.remaining, remaining)
+
+        self.limit = int(headers.get('X-RateLimit-Limit', 1))
+        self.remaining = remaining
+        self.reset_after = float(headers.get('X-RateLimit-Reset-After', 0.0))
+        self.reset = current + self.reset_after
+
+    def set_retry_after(self, retry_after):
+        self.known = True
+        self.remaining = 0
+        self.reset = monotonic() + retry_after
+        self.reset_after = max(self.reset_after, retry_after)
+
+        if self.limit is None:
+            self.limit = 1
+
+
 class HTTPRatelimiter:
+    """Rate limits the requests of a client per bucket, and globally after a global 429
+
+    Routes are mapped to the bucket hashes of the X-RateLimit-Bucket header,
+    buckets are split by the major parameter of the route (channel, guild
+    or webhook). Requests wait before they are sent once the bucket has
+    no requests remaining, so limits are not hit in the first place.
+    Buckets whose window is over are dropped every SWEEP_INTERVAL seconds.
+    """
+
     DEFAULT_TIMEOUT = 10
+    SWEEP_INTERVAL = 60.0
 
     def __init__(self, id):
         self.id = id
-        self.lock = Lock()
-        self.after = 0.0
-        self.last = time()
 
-    def set(self, data):
-        """Set the retry after value."""
+        # (method, path) -> bucket hash
+        self._hashes = {}
 
-        self.last = time()
-        if 'retry_after' in data:
-            retry_after = data['retry_after']
-        else:
-            retry_after = self.DEFAULT_TIMEOUT
+        # (bucket hash or (method, path), major parameter) -> HTTPBucket
+        self._buckets = {}
 
-        self.after = retry_after
+        # Every bucket waits until then after a global 429
+        self._global_reset = 0.0
 
-    def get_delay(self):
-        """Get the remaining delay in seconds."""
+        self._next_sweep = monotonic() + self.SWEEP_INTERVAL
 
-        current = time()
-        if (current - self.last) >= self.after:
-            self.after = 0.0
+    def _get_key(self, route):
+        return (self._hashes.get(route.key, route.key), route.major)
 
-        return self.after
+    def get_bucket(self, route):
+        key = self._get_key(route)
+        bucket = self._buckets.get(key)
 
-    async def __aexit__(self, exc_type, exc, tb):
-        return None
+        if bucket is None:
+            bucket = self._buckets[key] = HTTPBucket()
 
-    async def __aenter__(self):
+        return bucket
 
-        async with self.lock:
-            delta = self.get_delay()
+    def _log_delay(self, delta, scope):
+        _log.warning(
+            'Ratelimited (%s) for %.2f seconds',
+            scope,
+            delta,
+            extra={
+                'className': self.__class__.__name__,
+                'clientId': self.id,
+            }
+        )
 
-            if delta <= 0:
-                return None
+    async def acquire(self, route):
+        """Wait until a request can be sent on the route, return its HTTPBucket"""
+
+        bucket = self.get_bucket(route)
+
+        while True:
+            # Only the requests of one bucket wait on each other
+            async with bucket.lock:
+                if await self._wait(bucket, route):
+                    return bucket
+
+            # The route was mapped to a shared bucket meanwhile, wait there instead
+            bucket = bucket.moved
+
+    async def _wait(self, bucket, route):
+        """Wait until the bucket has a request left, False once it moved"""
 
-            _log.warning(
-                'Ratelimited for %.2f seconds',
-                delta,
-                extra={
-                    'className': self.__class__.__name__,
-                    'clientId': self.id,
-                }
-            )
+        while bucket.moved is None:
+            delta = self._global_reset - monotonic()
 
+            if delta > 0:
+                self._log_delay(delta, 'global')
+                await sleep(delta)
+                continue
+
+            # The first request finds out the limits, the others wait for it
+            if not bucket.known:
+                if bucket.discovery is None or bucket.discovery.done():
+                    bucket.discovery = get_running_loop().create_future()
+                    return True
+
+                await shield(bucket.discovery)
+                continue
+
+            delta = bucket.get_delay()
+
+            if delta <= 0:
+                return True
+
+            self._log_delay(delta, route.key)
             await sleep(delta)
+
+        return False
+
+    def _remap(self, route, bucket, bucket_hash):
+        """Key the bucket of the route by its hash, return the bucket to use from now on"""
+
+        # Only this route used the (method, path) key, nothing reaches it after the remap
+        if route.key not in self._hashes:
+            self._buckets.pop(self._get_key(route), None)
+
+        self._hashes[route.key] = bucket_hash
+
+        # Routes sharing a hash share the bucket
+        shared = self._buckets.setdefault(self._get_key(route), bucket)
+
+        # Requests still waiting on ours move over, so every request is counted once
+        if shared is not bucket:
+            bucket.moved = shared
+
+        return shared
+
+    def _sweep(self):
+        current = monotonic()
+
+        if current < self._next_sweep:
+            return None
+
+        self._next_sweep = current + self.SWEEP_INTERVAL
+
+        for key, bucket in list(self._buckets.items()):
+            if bucket.is_expired(current):
+                del self._buckets[key]
+
+    def update(self, route, bucket, headers):
+        """Learn the bucket of the route and its limits from the response headers"""
+
+        bucket_hash = headers.get('X-RateLimit-Bucket')
+
+        if bucket_hash is not None and self._hashes.get(route.key) != bucket_hash:
+            bucket = self._remap(route, bucket, bucket_hash)
+
+        bucket.update(headers)
+        self._sweep()
+
+    def set(self, bucket, data, headers):
+        """Handle a 429, data is the decoded body"""
+
+        retry_after = float(data.get('retry_after', self.DEFAULT_TIMEOUT))
+
+        if data.get('global', False) or headers.get('X-RateLimit-Global'):
+            self._global_reset = monotonic() + retry_after
+            return None
+
+        # update() may have merged the bucket of the request into a shared one
+        while bucket.moved is not None:
+            bucket = bucket.moved
+
+        bucket.set_retry_after(retry_after)
+
+
+class ExponentialBackoff:
+    """Exponential backoff with full jitter, the delay is random between 0 and the cap"""
+
+    def __init__(self, base=1.0, maximum=60.0):
+        self.base = base
+        self.maximum = maximum
+        self.attempts = 0
+
+    def delay(self):
+        cap = min(self.maximum, self.base * 2 ** self.attempts)
+        self.attempts += 1
+
+        return uniform(0, cap)
+
+    def reset(self):
+        self.attempts = 0
+
+
+class ConnectLimiter:
+    """Limits how many clients can be connecting (until READY or RESUMED) at once
+
+    Clients share a limit by passing the same instance as
+    Client(connect_limiter=...), without one they share a default limiter.
+    Every event loop gets a limit of its own, clients running on different
+    loops never wait on each other.
+    """
+
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+
+        # event loop -> Semaphore, created on first use so it belongs to that loop
+        self._semaphores = WeakKeyDictionary()
+
+    def _get_semaphore(self):
+        loop = get_running_loop()
+        semaphore = self._semaphores.get(loop)
+
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = Semaphore(self.concurrency)
+
+        return semaphore
+
+    async def acquire(self):
+        await self._get_semaphore().acquire()
+
+    def release(self):
+        self._get_semaphore().release()
@@ -0,0 +1,277 @@
+"""
+Copyright (C) [2024] [sepsemi]
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+
+import os
+import sqlite3
+
+from time import monotonic
+from abc import ABC, abstractmethod
+
+from .util import (
+    to_json,
+    from_json
+)
+from .constants import SESSION_JOURNAL_SIZE
+
+
+class SessionStore(ABC):
+    """Persists the gateway session of every client so it can RESUME after a restart
+
+    update() is called for every sequence, the writes are batched and only
+    happen once every interval seconds (and on flush).
+
+    RESUMED only replays what was missed, so the READY the session started
+    with is kept too, along with the events that changed the state since
+    (see ConnectionState.JOURNALED_EVENTS). A restarted client rebuilds its
+    state from them. Past journal_size events only the session is kept and
+    the client IDENTIFYs instead.
+    """
+
+    INTERVAL = 5.0
+
+    def __init__(self, interval=INTERVAL, journal_size=SESSION_JOURNAL_SIZE):
+        self.interval = interval
+        self.journal_size = journal_size
+        self._pending = {}
+
+        # id -> {'ready': ..., 'events': [[event, data], ...]}, written when changed
+        self._states = {}
+        self._changed = set()
+
+        self._last_write = monotonic()
+
+    @abstractmethod
+    def _read(self, id):
+        """Return the saved session as a dict with uri, session and sequence"""
+        ...
+
+    @abstractmethod
+    def _read_state(self, id):
+        ...
+
+    @abstractmethod
+    def _remove(self, id):
+        ...
+
+    @abstractmethod
+    def _write(self, sessions):
+        ...
+
+    @abstractmethod
+    def _write_states(self, states):
+        """Save the states, a state of None is deleted"""
+        ...
+
+    def load(self, id):
+        """Return the saved session, with the ready and events to rebuild the state from (or None)"""
+
+        session = self._read(id)
+
+        if session is None:
+            return None
+
+        state = self._read_state(id)
+
+        # Events recorded from now on are added to the saved ones
+        if state is not None:
+            self._states[id] = state
+
+        return {
+            **session,
+            'ready': state['ready'] if state is not None else None,
+            'events': state['events'] if state is not None else []
+        }
+
+    def delete(self, id):
+        self._pending.pop(id, None)
+        self._states.pop(id, None)
+        self._changed.discard(id)
+
+        self._remove(id)
+
+    def update(self, id, uri, session, sequence):
+        self._pending[id] = {
+            'uri': uri,
+            'session': session,
+            'sequence': sequence
+        }
+
+        if monotonic() - self._last_write >= self.interval:
+            self.flush()
+
+    def set_ready(self, id, ready):
+        """Start over from a new READY"""
+
+        self._states[id] = {'ready': ready, 'events': []}
+        self._changed.add(id)
+
+    def record(self, id, event, data):
+        """Add an event that changed the state since READY"""
+
+        state = self._states.get(id)
+
+        if state is None:
+            return None
+
+        if len(state['events']) >= self.journal_size:
+            del self._states[id]
+        else:
+            state['events'].append([event, data])
+
+        self._changed.add(id)
+
+    def flush(self):
+        if self._pending:
+            self._write(self._pending)
+            self._pending = {}
+
+        if self._changed:
+            self._write_states({id: self._states.get(id) for id in self._changed})
+            self._changed = set()
+
+        self._last_write = monotonic()
+
+
+class FileSessionStore(SessionStore):
+    """Keeps the sessions in a JSON file, replaced atomically on every write
+
+    The state of every client is kept next to it, in <path>.<id>.
+    """
+
+    def __init__(self, path, interval=SessionStore.INTERVAL, journal_size=SESSION_JOURNAL_SIZE):
+        super().__init__(interval=interval, journal_size=journal_size)
+        self.path = path
+        self._sessions = self._read_file(path) or {}
+
+    def _read_file(self, path):
+        try:
+            with open(path, 'rb') as fp:
+                return from_json(fp.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_file(self, path, data):
+        temporary = path + '.tmp'
+
+        with open(temporary, 'wb') as fp:
+            fp.write(to_json(data))
+
+        os.replace(temporary, path)
+
+    def _get_state_path(self, id):
+        return '{}.{}'.format(self.path, id)
+
+    def _read(self, id):
+        return self._sessions.get(id)
+
+    def _read_state(self, id):
+        return self._read_file(self._get_state_path(id))
+
+    def _remove(self, id):
+        self._write_states({id: None})
+
+        if self._sessions.pop(id, None) is not None:
+            self._write_file(self.path, self._sessions)
+
+    def _write(self, sessions):
+        self._sessions.update(sessions)
+        self._write_file(self.path, self._sessions)
+
+    def _write_states(self, states):
+        for id, state in states.items():
+            if state is not None:
+                self._write_file(self._get_state_path(id), state)
+                continue
+
+            try:
+                os.remove(self._get_state_path(id))
+            except FileNotFoundError:
+                pass
+
+
+class SQLiteSessionStore(SessionStore):
+    """Keeps the sessions in a SQLite database"""
+
+    def __init__(self, path, interval=SessionStore.INTERVAL, journal_size=SESSION_JOURNAL_SIZE):
+        super().__init__(interval=interval, journal_size=journal_size)
+        self.path = path
+
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'id TEXT PRIMARY KEY, uri TEXT, session TEXT, sequence INTEGER)'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS states ('
+            'id TEXT PRIMARY KEY, state BLOB)'
+        )
+        self._connection.commit()
+
+    def _read(self, id):
+        row = self._connection.execute(
+            'SELECT uri, session, sequence FROM sessions WHERE id = ?',
+            (id,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return dict(zip(('uri', 'session', 'sequence'), row))
+
+    def _read_state(self, id):
+        row = self._connection.execute(
+            'SELECT state FROM states WHERE id = ?',
+            (id,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return from_json(row[0])
+
+    def _remove(self, id):
+        self._connection.execute('DELETE FROM sessions WHERE id = ?', (id,))
+        self._connection.execute('DELETE FROM states WHERE id = ?', (id,))
+        self._connection.commit()
+
+    def _write(self, sessions):
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO sessions (id, uri, session, sequence) VALUES (?, ?, ?, ?)',
+            [
+                (id, session['uri'], session['session'], session['sequence'])
+                for id, session in sessions.items()
+            ]
+        )
+        self._connection.commit()
+
+    def _write_states(self, states):
+        for id, state in states.items():
+            if state is None:
+                self._connection.execute('DELETE FROM states WHERE id = ?', (id,))
+            else:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO states (id, state) VALUES (?, ?)',
+                    (id, to_json(state))
+                )
+
+        self._connection.commit()
+
+    def close(self):
+        self.flush()
+        self._connection.close()
@@ -19,7 +19,13 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 from .constants import (
     TOKEN_ID_LENGTH,
-    HEARTBEAT_TIMEOUT
+    HEARTBEAT_TIMEOUT,
+    INGEST_QUEUE_SIZE,
+    CAPABILITIES,
+    MAX_MESSAGES,
+    RECONNECT_BACKOFF_BASE,
+    RECONNECT_BACKOFF_MAX,
+    MAX_CONCURRENT_CONNECTS
 )
 
 from .device import (
@@ -31,8 +37,22 @@ from .user import (
     ClientUser
 )
 
+from .enum import Capabilities
 from .guild import Guild
-from .channel import channel_factory
+from .cache import MessageCache
+from .ratelimit import (
+    ConnectLimiter,
+    ExponentialBackoff
+)
+from .metrics import (
+    LoopStats,
+    MetricsSink,
+    LatencyStats
+)
+from .channel import (
+    ChannelType,
+    channel_factory
+)
 
 from .message import (
     PartialMessage,
@@ -41,11 +61,39 @@ from .message import (
 )
 
 from copy import copy
+from weakref import WeakValueDictionary
+
+# Shared by all clients that don't bring their own ConnectLimiter, per event loop
+DEFAULT_CONNECT_LIMITER = ConnectLimiter(MAX_CONCURRENT_CONNECTS)
+
+
+def _ignore_dispatch(event, *args, **kwargs):
+    # Replaces the dispatch while ConnectionState.restore replays events
+    return None
 
 
 class ConnectionState:
 
-    def __init__(self, loop, token, dispatch, http):
+    # Gateway events that are only parsed when one of these client events is handled,
+    # everything not listed here feeds the cache and is always parsed
+    EVENT_CONSUMERS = {
+        'MESSAGE_CREATE': ('message', 'message_edit', 'message_delete'),
+        'MESSAGE_UPDATE': ('message_edit',),
+        'MESSAGE_DELETE': ('message_delete',),
+    }
+
+    # Client events that need the message cache
+    CACHED_MESSAGE_EVENTS = ('message_edit', 'message_delete')
+
+    # Events that change the state READY built, kept by the SessionStore to rebuild it after a restart
+    JOURNALED_EVENTS = frozenset((
+        'CHANNEL_CREATE', 'CHANNEL_UPDATE', 'CHANNEL_DELETE',
+        'THREAD_CREATE', 'THREAD_UPDATE', 'THREAD_DELETE',
+        'GUILD_CREATE', 'GUILD_UPDATE', 'GUILD_DELETE',
+        'GUILD_ROLE_CREATE', 'GUILD_ROLE_UPDATE', 'GUILD_ROLE_DELETE'
+    ))
+
+    def __init__(self, loop, token, dispatch, http, handlers=(), **options):
         self.loop = loop
         self.token = token
         self.http = http
@@ -54,7 +102,51 @@ class ConnectionState:
         self.device = self._get_device()
         self.heartbeat_timeout = HEARTBEAT_TIMEOUT
 
-        self.parsers = self._initialize_parsers()
+        # Frames of at least this many bytes are inflated and decoded in the executor
+        self.offload_threshold = options.get('offload_threshold', None)
+        self.executor = options.get('executor', None)
+
+        # Gateway to connect to instead of Discord's, e.g. a MockGateway
+        self.gateway = options.get('gateway', None)
+
+        # Capabilities sent on IDENTIFY, dropping the ones we don't use shrinks READY
+        self.capabilities = Capabilities(options.get('capabilities', CAPABILITIES))
+
+        # Path of a file the raw gateway frames are appended to
+        self.capture = options.get('capture', None)
+
+        # Delay between reconnects, and the limiter shared by every client on the loop
+        self.backoff = ExponentialBackoff(
+            base=options.get('backoff_base', RECONNECT_BACKOFF_BASE),
+            maximum=options.get('backoff_max', RECONNECT_BACKOFF_MAX)
+        )
+        self.connect_limiter = options.get('connect_limiter') or DEFAULT_CONNECT_LIMITER
+
+        # A SessionStore to resume from after a restart
+        self.session_store = options.get('session_store', None)
+
+        # A GuildCache so READY only carries the guilds that changed
+        self.guild_cache = options.get('guild_cache', None)
+
+        # Where metrics are reported to, see MetricsSink
+        self.metrics = options.get('metrics') or MetricsSink()
+        self.latency_stats = LatencyStats()
+        self.loop_stats = LoopStats()
+
+        # Message cache limits, see MessageCache
+        self.max_messages = options.get('max_messages', MAX_MESSAGES)
+        self.max_channel_messages = options.get('max_channel_messages', None)
+        self.message_ttl = options.get('message_ttl', None)
+        self.message_cache_policy = options.get('message_cache_policy', MessageCache.FIFO)
+
+        # Packets received but not yet processed, see IngestQueue for the overflow policies
+        self.ingest_queue_size = options.get('ingest_queue_size', INGEST_QUEUE_SIZE)
+        self.ingest_overflow = options.get('ingest_overflow', 'block')
+
+        self.parsers = {}
+        self._all_parsers = self._initialize_parsers()
+        self.update_handlers(handlers)
+
         self.clear()
 
     def _initialize_parsers(self):
@@ -69,34 +161,184 @@ class ConnectionState:
 
         return parsers
 
+    def update_handlers(self, handlers):
+        """Only keep the parsers for events that are cached or handled"""
+
+        self.handlers = frozenset(handlers)
+
+        # Updated in place, the gateway holds a reference to this dict
+        self.parsers.clear()
+
+        for event, func in self._all_parsers.items():
+            consumers = self.EVENT_CONSUMERS.get(event)
+
+            if consumers is not None and self.handlers.isdisjoint(consumers):
+                continue
+
+            self.parsers[event] = func
+
     def _get_device(self):
         return create_device()
 
     def clear(self):
         self._ready = False
-        self._messages = {}
+        self._messages = MessageCache(
+            max_messages=self.max_messages,
+            max_channel_messages=self.max_channel_messages,
+            ttl=self.message_ttl,
+            policy=self.message_cache_policy
+        )
         self._channels = {}
         self._guilds = {}
         self._roles = {}
-        self._users = {}
         self._user = None
 
-    def _create_client_user(self, data):
-        """Creates a ClientUser"""
+        # Interned users live as long as something refers to them, the ones from READY are kept
+        self._users = WeakValueDictionary()
+        self._ready_users = []
+
+        # Secondary indexes, kept up to date by the channel and guild parsers
+        self._channel_guilds = {}
+        self._dm_channels = {}
+
+    def store_user(self, data):
+        """Returns the cached User for the data, updated in place, or caches a new one"""
+
+        user = self._users.get(int(data['id']))
+
+        if user is not None:
+            user._update(data)
+            return user
 
         user = User(state=self, data=data)
+        self._users[user.id] = user
+
+        return user
+
+    def _create_client_user(self, data):
+        """Creates a ClientUser"""
 
         # Add ourselfs to the collection
-        self._users[user.id] = user
+        user = self.store_user(data)
+        self._ready_users.append(user)
 
         return ClientUser(user=user, data=data)
 
+    def _add_channel(self, channel, guild=None):
+        """Adds the channel to the cache and the indexes"""
+
+        self._channels[channel.id] = channel
+
+        if guild is not None:
+            self._channel_guilds[channel.id] = guild
+
+        # A DM without a (cached) recipient can't be looked up by user
+        if channel.type is ChannelType.DM and channel.recipients:
+            self._dm_channels[channel.recipients[0].id] = channel
+
+    def _remove_channel(self, channel_id):
+        """Removes the channel from the cache, the indexes and its guild"""
+
+        channel = self._channels.pop(channel_id, None)
+
+        guild = self._channel_guilds.pop(channel_id, None)
+        if guild is not None:
+            guild.channels.pop(channel_id, None)
+
+        if channel is not None and channel.type is ChannelType.DM and channel.recipients:
+            self._dm_channels.pop(channel.recipients[0].id, None)
+
+        self._messages.remove_channel(channel_id)
+
+        return channel
+
     def _add_guild_from_data(self, data):
         """Creates and adds the Guild to the state processing everything"""
 
         guild = Guild(state=self, data=data)
         self._guilds[guild.id] = guild
 
+        return guild
+
+    def _remove_guild(self, guild_id):
+        """Removes the guild along with its channels, roles and cached messages"""
+
+        guild = self._guilds.pop(guild_id, None)
+
+        if guild is None:
+            return None
+
+        for channel_id in list(guild.channels):
+            self._remove_channel(channel_id)
+
+        for role_id in list(guild.roles):
+            guild._remove_role(role_id)
+
+        return guild
+
+    def _cache_guild(self, data):
+        """Saves the guild data to the GuildCache along with its hashes"""
+
+        if self.guild_cache is None or 'guild_hashes' not in data:
+            return None
+
+        self.guild_cache.set(self.id, data['id'], data['guild_hashes'], data)
+
+    def _rebuild_guild_data(self, data):
+        """Applies the partial_updates of a partial READY guild to the cached data"""
+
+        if self.guild_cache is None:
+            return None
+
+        cached = self.guild_cache.get(self.id, data['id'])
+
+        if cached is None:
+            return None
+
+        guild_data = dict(cached)
+        updates = data.get('partial_updates', {})
+
+        for key, deleted_key in (('channels', 'deleted_channel_ids'), ('roles', 'deleted_role_ids')):
+            items = {item['id']: item for item in guild_data.get(key, ())}
+
+            for id in updates.get(deleted_key, ()):
+                items.pop(str(id), None)
+
+            for item in updates.get(key, ()):
+                items[item['id']] = item
+
+            guild_data[key] = list(items.values())
+
+        # Everything else is guild metadata that replaces ours
+        for key, value in updates.items():
+            if key not in ('channels', 'roles', 'deleted_channel_ids', 'deleted_role_ids'):
+                guild_data[key] = value
+
+        guild_data['guild_hashes'] = data.get('guild_hashes', cached.get('guild_hashes'))
+
+        return guild_data
+
+    def _get_guild(self, data):
+        """Gets the guild of a payload by its guild_id, None outside of guilds"""
+
+        if 'guild_id' not in data:
+            return None
+
+        return self._guilds.get(int(data['guild_id']))
+
+    def _store_channel(self, data):
+        """Creates the channel and adds it to its guild (if any) and the state"""
+
+        guild = self._get_guild(data)
+
+        if guild is not None:
+            return guild._add_channel_from_data(data)
+
+        channel = channel_factory(state=self, data=data)
+        self._add_channel(channel)
+
+        return channel
+
     def _create_message(self, data):
         channel, guild = self._get_guild_channel(data)
 
@@ -106,56 +348,226 @@ class ConnectionState:
         # Create the message from the channel and or guild
         return message_factory(guild, channel, data)
 
-    def parse_ready(self, data):
+    def _get_ready_guilds(self, guilds):
+        """Returns the complete data of the READY guilds, None if a partial one isn't cached"""
+
+        complete = []
+
+        for guild_data in guilds:
+            # Only the changes were sent, the rest comes from the GuildCache
+            if guild_data.get('data_mode') == 'partial':
+                guild_data = self._rebuild_guild_data(guild_data)
+
+                # The hashes we sent are no good (or there is no cache at all), start over without any
+                if guild_data is None:
+                    if self.guild_cache is not None:
+                        self.guild_cache.clear(self.id)
+
+                    return None
+
+            complete.append(guild_data)
+
+        return complete
+
+    def _flush_guild_cache(self):
+        """Writes the GuildCache in the executor, READY doesn't wait on the disk"""
+
+        if self.guild_cache is not None:
+            self.loop.run_in_executor(self.executor, self.guild_cache.flush)
+
+    def _save_ready(self, data, guilds):
+        """Hands READY to the SessionStore, with the complete guilds so no GuildCache is needed to restore it"""
+
+        if self.session_store is None:
+            return None
+
+        self.session_store.set_ready(self.id, {
+            'user': data['user'],
+            'users': data.get('users', []),
+            'private_channels': data['private_channels'],
+            'guilds': guilds
+        })
+
+    def restore(self, ready, events):
+        """Rebuilds the state of a previous process from its READY and the events after it
+
+        The events are not dispatched again, only ready is once the state is rebuilt.
+        """
+
+        dispatch, self.dispatch = self.dispatch, _ignore_dispatch
+
+        try:
+            self._load_ready(ready, ready['guilds'])
+
+            for event, data in events:
+                self._all_parsers[event](data)
+        finally:
+            self.dispatch = dispatch
+
+        self._ready = True
+        self.dispatch('ready')
+
+    def _load_ready(self, data, guilds):
+        self._ready_users = []
         self._user = self._create_client_user(data['user'])
 
-        for user_data in data['users']:
-            user = User(state=self, data=user_data)
-            self._users[user.id] = user
+        # Only sent with DEDUPE_USER_OBJECTS, the channels then refer to them by recipient_ids
+        for user_data in data.get('users', ()):
+            self._ready_users.append(self.store_user(user_data))
 
         for channel_data in data['private_channels']:
             channel = channel_factory(state=self, data=channel_data)
-            self._channels[channel.id] = channel
+            self._add_channel(channel)
 
-        for guild_data in data['guilds']:
+        for guild_data in guilds:
             self._add_guild_from_data(guild_data)
 
+    def parse_ready(self, data):
+        """Returns the complete guild data, None when READY has to be requested again"""
+
+        guilds = self._get_ready_guilds(data['guilds'])
+
+        if guilds is None:
+            return None
+
+        self._load_ready(data, guilds)
+        self._save_ready(data, guilds)
+
+        for guild_data in guilds:
+            self._cache_guild(guild_data)
+
+        self._flush_guild_cache()
+
         self._ready = True
         self.dispatch('ready')
 
+        return guilds
+
     def parse_channel_create(self, data):
-        channel = channel_factory(state=self, data=data)
-        self._channels[channel.id] = channel
+        channel = self._store_channel(data)
 
         self.dispatch('channel_create', channel)
 
     def parse_channel_update(self, data):
-        channel_id = int(data['id'])
+        channel = self._channels.get(int(data['id']))
 
-        channel = self._channels[channel_id]
-        channel._update(data)
+        # We missed the create, so start caching it now
+        if channel is None:
+            self._store_channel(data)
+        else:
+            channel._update(data)
 
         self.dispatch('channel_update', data)
 
     def parse_channel_delete(self, data):
-        return None
+        channel = self._remove_channel(int(data['id']))
+
+        if channel is not None:
+            self.dispatch('channel_delete', channel)
+
+    def parse_thread_create(self, data):
+        channel = self._store_channel(data)
+
+        self.dispatch('thread_create', channel)
+
+    def parse_thread_update(self, data):
+        channel = self._channels.get(int(data['id']))
+
+        if channel is None:
+            channel = self._store_channel(data)
+        else:
+            channel._update(data)
+
+        self.dispatch('thread_update', channel)
+
+    def parse_thread_delete(self, data):
+        channel = self._remove_channel(int(data['id']))
+
+        if channel is not None:
+            self.dispatch('thread_delete', channel)
+
+    def parse_guild_create(self, data):
+        # Sent during outages, the guild becomes available with a later GUILD_CREATE
+        if data.get('unavailable', False):
+            return None
+
+        guild = self._guilds.get(int(data['id']))
+
+        # Back from an outage, update it in place so the cached messages are kept
+        if guild is not None:
+            guild._update(data)
+            guild._sync_channels([*data['channels'], *data.get('threads', ())])
+        else:
+            guild = self._add_guild_from_data(data)
+
+        self._cache_guild(data)
+
+        self.dispatch('guild_create', guild)
+
+    def parse_guild_update(self, data):
+        guild = self._guilds.get(int(data['id']))
+
+        if guild is None:
+            return None
+
+        guild._update(data)
+
+        self.dispatch('guild_update', guild)
+
+    def parse_guild_delete(self, data):
+        # An outage, not a guild we left, the cache is kept until it is available again
+        if data.get('unavailable', False):
+            return None
+
+        guild = self._remove_guild(int(data['id']))
+
+        if self.guild_cache is not None:
+            self.guild_cache.delete(self.id, data['id'])
+
+        if guild is not None:
+            self.dispatch('guild_delete', guild)
+
+    def parse_guild_role_create(self, data):
+        guild = self._get_guild(data)
+
+        if guild is None:
+            return None
+
+        role = guild._add_role_from(data['role'])
+
+        self.dispatch('guild_role_create', role)
+
+    def parse_guild_role_update(self, data):
+        guild = self._get_guild(data)
+
+        if guild is None:
+            return None
+
+        role = guild._add_role_from(data['role'])
+
+        self.dispatch('guild_role_update', role)
+
+    def parse_guild_role_delete(self, data):
+        guild = self._get_guild(data)
+
+        if guild is None:
+            return None
+
+        role = guild._remove_role(int(data['role_id']))
+
+        if role is not None:
+            self.dispatch('guild_role_delete', role)
 
     def _get_guild_channel(self, data):
-        """Gets a channel by id or channel and guild by id"""
+        """Gets a channel and its guild (None outside of guilds) by the channel id"""
 
         channel_id = int(data['channel_id'])
-        try:
-            channel = self._channels[channel_id]
-        except KeyError:
-            return (None, None)
+        channel = self._channels.get(channel_id)
 
-        try:
-            guild_id = int(data['guild_id'])
-            guild = self._guilds[guild_id]
-        except KeyError:
-            return (channel, None)
+        if channel is None:
+            return (None, None)
 
-        return channel, guild
+        return channel, self._channel_guilds.get(channel_id)
 
     def parse_message_create(self, data):
 
@@ -166,29 +578,31 @@ class ConnectionState:
             return None
 
         self.dispatch('message', message)
-        self._messages[message.id] = message
+
+        # Cached messages are only used to dispatch edits and deletes
+        if not self.handlers.isdisjoint(self.CACHED_MESSAGE_EVENTS):
+            self._messages.add(message)
 
     def parse_message_update(self, data):
         # Create a partial message because we don't know if it exists
 
         raw = PartialMessage(data)
 
-        if raw.id not in self._messages.keys():
-            return None
-
         # This is not a message with content
         if 'content' not in data.keys():
             return None
 
         # Fetch the old message from the cache
-        message = self._messages[raw.id]
+        message = self._messages.get(raw.id)
+
+        if message is None:
+            return None
 
         # Create a soft copy of the message
         older_message = copy(message)
 
-        # Update the message data
-
-        message._update(data)
+        # Update the message data, the cache accounts for the new content
+        self._messages.update(message, data)
 
         self.dispatch('message_edit', older_message, message)
 
@@ -196,8 +610,10 @@ class ConnectionState:
         # Create a partial message because we don't know if it exists
         raw = PartialMessage(data)
 
-        # Find the message in the current cache
-        if raw.id not in self._messages.keys():
+        # Remove the message from the current cache
+        message = self._messages.remove(raw.id)
+
+        if message is None:
             return None
 
-        self.dispatch('message_delete', self._messages[raw.id])
+        self.dispatch('message_delete', message)
@@ -22,6 +22,17 @@ from dataclasses import dataclass
 
 @dataclass
 class User:
+    __slots__ = (
+        '_state',
+        'id',
+        'username',
+        'discriminator',
+        'avatar',
+        'banner',
+        'bot',
+        '__weakref__',
+    )
+
     id: int
     username: str
     discriminator: int
@@ -32,6 +43,9 @@ class User:
     def __init__(self, state, data):
         self._state = state
         self.id = int(data['id'])
+        self._update(data)
+
+    def _update(self, data):
         self.username = data['username']
         self.discriminator = int(data['discriminator'])
         self.avatar = data['avatar']
@@ -46,6 +60,18 @@ class User:
 
 @dataclass
 class ClientUser:
+    __slots__ = (
+        '_state',
+        'id',
+        'username',
+        'discriminator',
+        'avatar',
+        'banner',
+        'email',
+        'verified',
+        'premium_type',
+    )
+
     id: int
     username: str
     discriminator: int
@@ -0,0 +1,156 @@
+"""
+Bucket splitting, remapping and 429 handling of the HTTPRatelimiter.
+
+Usage: python -m pytest tests
+"""
+
+from time import monotonic
+
+from asyncio import (
+    run,
+    sleep,
+    wait_for,
+    ensure_future,
+    TimeoutError
+)
+
+from discord.http import Route
+from discord.ratelimit import HTTPRatelimiter
+from discord.iterators import SearchIterator
+
+
+def create_route(channel_id, path='/channels/{channel_id}/messages'):
+    return Route('GET', path, channel_id=channel_id)
+
+
+def create_headers(bucket_hash, remaining, reset_after=10.0):
+    return {
+        'X-RateLimit-Bucket': bucket_hash,
+        'X-RateLimit-Limit': '5',
+        'X-RateLimit-Remaining': str(remaining),
+        'X-RateLimit-Reset-After': str(reset_after)
+    }
+
+
+async def request(limiter, route, headers):
+    """Acquire the bucket of the route and answer with headers"""
+
+    bucket = await limiter.acquire(route)
+
+    try:
+        limiter.update(route, bucket, headers)
+    finally:
+        bucket.release()
+
+    return bucket
+
+
+async def is_blocked(limiter, route):
+    try:
+        await wait_for(limiter.acquire(route), 0.05)
+    except TimeoutError:
+        return True
+
+    return False
+
+
+def test_buckets_are_split_by_major_parameter():
+    async def main():
+        limiter = HTTPRatelimiter(id=None)
+
+        await request(limiter, create_route(1), create_headers('messages', 0))
+
+        assert await is_blocked(limiter, create_route(1))
+        assert not await is_blocked(limiter, create_route(2))
+
+    run(main())
+
+
+def test_routes_sharing_a_hash_share_the_bucket():
+    async def main():
+        limiter = HTTPRatelimiter(id=None)
+        first = create_route(1)
+        second = create_route(1, '/channels/{channel_id}/pins')
+
+        bucket = await request(limiter, first, create_headers('shared', 1))
+        merged = await request(limiter, second, create_headers('shared', 0))
+
+        assert merged.moved is bucket
+        assert limiter.get_bucket(second) is bucket
+
+        # The (method, path) keys are gone, only the hash reaches the bucket
+        assert list(limiter._buckets) == [('shared', '1')]
+        assert await is_blocked(limiter, first)
+
+    run(main())
+
+
+def test_remap_moves_waiters_to_the_shared_bucket():
+    async def main():
+        limiter = HTTPRatelimiter(id=None)
+        route = create_route(1)
+        other = create_route(1, '/channels/{channel_id}/pins')
+
+        # The shared bucket is exhausted for a short while
+        shared = await request(limiter, other, create_headers('shared', 0, 0.2))
+
+        # The first request of the route discovers its bucket, a second one waits
+        bucket = await limiter.acquire(route)
+        waiter = ensure_future(limiter.acquire(route))
+        await sleep(0)
+
+        limiter.update(route, bucket, create_headers('shared', 0, 0.2))
+        bucket.release()
+
+        assert bucket.moved is shared
+        assert await wait_for(waiter, 1) is shared
+
+    run(main())
+
+
+def test_429_waits_for_retry_after():
+    async def main():
+        limiter = HTTPRatelimiter(id=None)
+        route = create_route(1)
+
+        bucket = await request(limiter, route, create_headers('messages', 3))
+        limiter.set(bucket, {'retry_after': 0.2}, {})
+
+        start = monotonic()
+        await limiter.acquire(route)
+        assert monotonic() - start >= 0.15
+
+    run(main())
+
+
+def test_global_429_waits_on_every_bucket():
+    async def main():
+        limiter = HTTPRatelimiter(id=None)
+
+        bucket = await request(limiter, create_route(1), create_headers('messages', 3))
+        limiter.set(bucket, {'retry_after': 10, 'global': True}, {})
+
+        assert await is_blocked(limiter, create_route(2))
+
+    run(main())
+
+
+def test_expired_buckets_are_dropped():
+    async def main():
+        limiter = HTTPRatelimiter(id=None)
+        limiter.SWEEP_INTERVAL = limiter._next_sweep = 0.0
+
+        await request(limiter, create_route(1), create_headers('messages', 3, 0.0))
+        await request(limiter, create_route(2), create_headers('messages', 3, 10.0))
+
+        assert list(limiter._buckets) == [('messages', '2')]
+
+    run(main())
+
+
+def test_search_routes_have_a_major_parameter():
+    channel = type('Channel', (), {'id': 1})()
+    guild = type('Guild', (), {'id': 2})()
+
+    assert SearchIterator(None, None, channel)._get_route().major == '1'
+    assert SearchIterator(None, guild, channel)._get_route().major == '2'
@@ -0,0 +1,131 @@
+"""
+Restarting a client with a saved session against the MockGateway.
+
+Usage: python -m pytest tests
+"""
+
+from asyncio import (
+    run,
+    sleep,
+    wait_for,
+    get_running_loop
+)
+
+from discord import Client
+from discord.session import FileSessionStore
+
+from benchmarks.mockgateway import MockGateway
+
+TOKEN = 'session-test-token'
+
+
+class CountingClient(Client):
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.messages = 0
+
+    async def on_message(self, ctx):
+        self.messages += 1
+
+
+async def run_client(gateway, path):
+    """Connect until a message was delivered, then close the client"""
+
+    client = CountingClient(
+        loop=get_running_loop(),
+        gateway=gateway.uri,
+        session_store=FileSessionStore(path)
+    )
+
+    task = client.loop.create_task(client.start(TOKEN))
+
+    for _ in range(500):
+        if client.messages:
+            break
+
+        await sleep(0.01)
+
+    await client.close()
+    await wait_for(task, timeout=5)
+
+    return client
+
+
+async def restart(path):
+    async with MockGateway(rate=200) as gateway:
+        first = await run_client(gateway, path)
+        second = await run_client(gateway, path)
+
+    return gateway, first, second
+
+
+def test_restarted_client_resumes(tmp_path):
+    gateway, first, second = run(restart(str(tmp_path / 'sessions.json')))
+
+    assert first.messages > 0
+
+    # The state is rebuilt from the saved READY, the session is resumed
+    assert second.user is not None
+    assert len(list(second.channels)) == 1
+    assert second.messages > 0
+    assert gateway.identifies == 1
+    assert gateway.resumes == 1
+
+
+def create_client(store):
+    """A client with its state, as connect() sets it up"""
+
+    client = CountingClient(loop=get_running_loop(), session_store=store)
+    client.token = TOKEN
+    client._connection = client._get_connection()
+
+    return client
+
+
+def test_journaled_events_are_replayed(tmp_path):
+    path = str(tmp_path / 'sessions.json')
+
+    async def main():
+        store = FileSessionStore(path)
+        client = create_client(store)
+
+        ready = MockGateway().get_ready('session')
+        guild_id = ready['guilds'][0]['id']
+
+        store.update(client._connection.id, 'ws://resume', 'session', 10)
+        client._connection.parse_ready(ready)
+
+        channel = {
+            'id': '1', 'type': 0, 'flags': 0, 'name': 'new', 'position': 1,
+            'permission_overwrites': [], 'guild_id': guild_id
+        }
+        store.record(client._connection.id, 'CHANNEL_CREATE', channel)
+        store.flush()
+
+        # A new process
+        restarted = create_client(FileSessionStore(path))
+
+        return restarted._get_saved_parameters(), restarted
+
+    parameters, restarted = run(main())
+
+    assert parameters['resume'] is True
+    assert parameters['sequence'] == 10
+    assert restarted._connection._ready
+    assert len(list(restarted.channels)) == 2
+
+
+def test_journal_overflow_drops_the_ready(tmp_path):
+    store = FileSessionStore(str(tmp_path / 'sessions.json'), journal_size=1)
+
+    store.update('client', 'ws://resume', 'session', 1)
+    store.set_ready('client', {'guilds': []})
+    store.record('client', 'GUILD_DELETE', {'id': '1'})
+    store.record('client', 'GUILD_DELETE', {'id': '2'})
+    store.flush()
+
+    saved = FileSessionStore(store.path).load('client')
+
+    assert saved['session'] == 'session'
+    assert saved['ready'] is None
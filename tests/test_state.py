@@ -0,0 +1,68 @@
+"""
+ConnectionState parsers fed with MockGateway payloads.
+
+Usage: python -m pytest tests
+"""
+
+from asyncio import (
+    run,
+    get_running_loop
+)
+
+from discord import Client
+
+from benchmarks.mockgateway import MockGateway
+
+TOKEN = 'state-test-token'
+
+
+class CachingClient(Client):
+    """Handles deletes, so messages are cached"""
+
+    async def on_message_delete(self, message):
+        pass
+
+
+def create_state(cls=Client, **options):
+    """The state of a client, as connect() sets it up"""
+
+    async def main():
+        client = cls(loop=get_running_loop(), **options)
+        client.token = TOKEN
+
+        return client._get_connection()
+
+    return run(main())
+
+
+def test_partial_guild_without_guild_cache_asks_for_ready_again():
+    state = create_state()
+    ready = MockGateway().get_ready('session')
+
+    ready['guilds'][0] = {
+        'id': ready['guilds'][0]['id'],
+        'data_mode': 'partial',
+        'partial_updates': {}
+    }
+
+    assert state.parse_ready(ready) is None
+    assert not state._ready
+
+
+def test_guild_back_from_outage_keeps_cached_messages():
+    state = create_state(CachingClient)
+    gateway = MockGateway(channels=2)
+    ready = gateway.get_ready('session')
+
+    state.parse_ready(ready)
+    state.parse_message_create(gateway.get_message())
+
+    guild = ready['guilds'][0]
+    state.parse_guild_delete({'id': guild['id'], 'unavailable': True})
+
+    # One of the channels was deleted during the outage
+    state.parse_guild_create({**guild, 'channels': guild['channels'][:1]})
+
+    assert len(state._messages) == 1
+    assert list(state._guilds[int(guild['id'])].channels) == [int(guild['channels'][0]['id'])]
+    assert int(guild['channels'][1]['id']) not in state._channels